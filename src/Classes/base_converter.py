@@ -12,6 +12,8 @@ without restriction, subject to the conditions specified in the license.
 
 
 # Standard Library Imports
+import re
+from array import array
 
 # Third-Party Imports
 
@@ -22,6 +24,9 @@ def main() -> None:
     convert = BaseConvert()
     print(f"Encoding 2542415: {convert.encode(2542415)}")
     print(f"Decoding ajJJD: {convert.to_decimal('ajJJD'):_}")
+    encoded = BaseConvert.encode_many([2, 0, 1, 1, 3, 336, 40_000])
+    print(f"Encoding many: {encoded}")
+    print(f"Decoding stream: {BaseConvert.decode_stream(encoded + '[2]')}")
 
     return
 
@@ -40,6 +45,14 @@ class BaseConvert:
     BASE = NUMERAL + UPPER + LOWER + EXTRAS + ABOVE_EXTRAS
     FOLDER_PATH = "database/"
 
+    # Lookup tables. Every BASE character fits in one latin-1 byte, so a run
+    # of single digit gaps can be decoded with bytes.translate.
+    DIGITS = {char: idx for idx, char in enumerate(BASE)}
+    BYTE_TABLE = bytes.maketrans(BASE.encode("latin-1"), bytes(range(len(BASE))))
+    TABLE_LIMIT = len(BASE) ** 2  # Every value below this is 1 or 2 digits
+    GROUP_PATTERN = re.compile(r":([^:|\[]{3,})\||:([^:|\[]{2})")
+    _encode_table = None
+
     def __init__(self, value=None):
         self.value = value
 
@@ -72,7 +85,7 @@ class BaseConvert:
         result = 0
 
         for char in self.value:
-            result = result * base + self.BASE.index(char)
+            result = result * base + self.DIGITS[char]
         return result
 
     def __repr__(self):
@@ -87,20 +100,113 @@ class BaseConvert:
         self.value = value if value is not None else self.value
         if self.value is None:
             raise ValueError("Value not provided.")
-        if self.value == 0:
-            return self.BASE[0]
-
-        result = ""
-        base = len(self.BASE)
-        while self.value > 0:
-            self.value, remainder = divmod(self.value, base)
-            result = self.BASE[remainder] + result
+        if self.value < self.TABLE_LIMIT:
+            return self.encode_table()[self.value]
+        return self.frame(self.digits(self.value))
+
+    @classmethod
+    def digits(cls, value: int) -> str:
+        """Plain base 174 digits of value, without any framing."""
+        if value == 0:
+            return cls.BASE[0]
+        base = len(cls.BASE)
+        result = []
+        while value > 0:
+            value, remainder = divmod(value, base)
+            result.append(cls.BASE[remainder])
+        return "".join(reversed(result))
+
+    @staticmethod
+    def frame(result: str) -> str:
+        """Adds the : and | group markers used by encode."""
         if len(result) > 1:
             result = ":" + result
         if len(result[1:]) > 2:
             result = result + "|"
         return result
 
+    @classmethod
+    def encode_table(cls) -> list:
+        """
+        Encoded strings for every value below TABLE_LIMIT, built once on first
+        use and shared by every instance.
+        """
+        if cls._encode_table is None:
+            cls._encode_table = [cls.frame(cls.digits(value))
+                                 for value in range(cls.TABLE_LIMIT)]
+        return cls._encode_table
+
+    @classmethod
+    def encode_many(cls, gaps) -> str:
+        """
+        Encodes a whole run of gaps in one pass. Gaps below TABLE_LIMIT come
+        straight out of the cached table, anything larger is built by hand.
+        :param gaps: Iterable of non negative ints.
+        :return: The encoded gaps joined together, without a [trailing] end.
+        """
+        table = cls.encode_table()
+        try:
+            return "".join(map(table.__getitem__, gaps))
+        except IndexError:
+            return "".join(table[gap] if gap < cls.TABLE_LIMIT else
+                           cls.frame(cls.digits(gap)) for gap in gaps)
+
+    @classmethod
+    def decode_stream(cls, encoded: str) -> (array, int):
+        """
+        Decodes a block's gap string in one pass. Runs of single digit gaps are
+        translated as bytes, only the :xx and :xxx| groups are handled one by one.
+        A group started with : runs to a | when the | comes before the next :
+        or [, otherwise it is two digits long.
+        :param encoded: Gap string, optionally ending in [trailing].
+        :return: (gaps, trailing) where trailing is None if there is no [ ] end.
+        """
+        trailing = None
+        end = encoded.find("[")
+        if end >= 0:
+            closing = encoded.find("]", end)
+            closing = len(encoded) if closing < 0 else closing
+            trailing = cls().to_decimal(encoded[end + 1:closing].strip(":|"))
+            encoded = encoded[:end]
+
+        gaps = array("Q")
+        parts = cls.GROUP_PATTERN.split(encoded)
+        for idx in range(0, len(parts), 3):
+            if parts[idx]:
+                gaps.extend(parts[idx].encode("latin-1").translate(cls.BYTE_TABLE))
+            if idx + 2 < len(parts):
+                group = parts[idx + 1] or parts[idx + 2]
+                value = 0
+                for char in group:
+                    value = value * len(cls.BASE) + cls.DIGITS[char]
+                gaps.append(value)
+        return gaps, trailing
+
+    @classmethod
+    def decode_batches(cls, encoded: str, batch_chars=1 << 20):
+        """
+        Decodes a gap string a slice at a time, so only one slice worth of
+        gaps is held at once. Slices are cut after a whole group, never
+        inside a :xx or :xxx| group. The [trailing] end is skipped.
+        :param encoded: Gap string, optionally ending in [trailing].
+        :param batch_chars: Rough number of characters per slice.
+        :return: Generator of array('Q') gap runs.
+        """
+        end = encoded.find("[")
+        end = len(encoded) if end < 0 else end
+        pos = 0
+        while pos < end:
+            cut = min(pos + batch_chars, end)
+            colon = encoded.rfind(":", pos, cut)
+            if colon >= 0 and cut < end:
+                # Same rule as decode_stream: | before the next : ends a long group
+                bar = encoded.find("|", colon, end)
+                after = encoded.find(":", colon + 1, end)
+                group_end = bar + 1 if bar >= 0 and (after < 0 or bar < after) else colon + 3
+                cut = max(cut, group_end)
+            yield cls.decode_stream(encoded[pos:cut])[0]
+            pos = cut
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,270 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import mmap
+import struct
+from itertools import accumulate, islice, repeat
+from operator import add
+
+# Third-Party Imports
+from bitarray import bitarray
+
+# Local Imports
+from Helper_Functions.wheel import WHEEL_PRIMES, number_bit, wheel_bit, wheel_primes
+
+# Constants
+BITMAP_DIR = "Database/bitmaps"  # Sieved block bitmaps
+BITMAP_HEADER = struct.Struct("<4sHHqq")  # magic, version, flags, start, size in bits
+BITMAP_MAGIC = b"PBIT"
+BITMAP_VERSION = 1
+BITMAP_COMPLETE = 1  # Header flag, set once every bit has been sieved
+WHEEL_MAGIC = b"PWHL"  # Mod 30 wheel packed bitmap, 8 bits per 30 numbers
+WHEEL_BATCH = 1 << 16  # Primes set or read per step when converting gaps
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    bitmap = BlockBitmap.create(os.path.join(BITMAP_DIR, "demo.bits"), 100)
+    bitmap.bits.setall(True)
+    bitmap.bits[:2] = False
+    for prime in (2, 3, 5, 7):
+        bitmap.bits[prime * prime:100:prime] = False
+    bitmap.flush(complete=True)
+    bitmap.close()
+
+    bitmap = BlockBitmap.open(os.path.join(BITMAP_DIR, "demo.bits"))
+    print(f"Primes below 100: {[n for n in range(100) if bitmap.is_prime(n)]}")
+    gaps = bitmap.gaps()
+    bitmap.close()
+
+    wheel = WheelBitmap.from_gaps(os.path.join(BITMAP_DIR, "demo.wheel.bits"), 0, 100, gaps)
+    print(f"Wheel bitmap: {len(wheel.mm) - BITMAP_HEADER.size} bytes, "
+          f"primes below 100: {[n for n in range(100) if wheel.is_prime(n)]}")
+    wheel.close()
+
+    return
+
+
+def bitmap_filename(filename) -> str:
+    """2_32-0000.json -> Database/bitmaps/2_32-0000.bits"""
+    return os.path.join(BITMAP_DIR, os.path.splitext(filename)[0] + ".bits")
+
+
+def open_bitmap(path, writable=False) -> "BlockBitmap":
+    """Map a bitmap file as a BlockBitmap or WheelBitmap, going by its magic."""
+    with open(path, "rb") as f:
+        magic = f.read(len(WHEEL_MAGIC))
+    cls = WheelBitmap if magic == WHEEL_MAGIC else BlockBitmap
+    return cls.open(path, writable)
+
+
+class BlockBitmap:
+    """
+    A block's sieve bitmap kept in a memory mapped file instead of anonymous
+    memory. Bit i stands for start + i. The bitarray is built straight on
+    the mapping, so the sieve writes into the page cache, the OS pages it
+    out as it likes and nothing is copied to save it. A finished bitmap can
+    be mapped again read only and probed one bit at a time.
+    """
+
+    MAGIC = BITMAP_MAGIC
+
+    def __init__(self, path, mm, start, size, writable, complete=False) -> None:
+        self.path = path
+        self.mm = mm
+        self.start = start
+        self.size = size
+        self.writable = writable
+        self.complete = complete  # Only complete bitmaps should be probed
+        self.view = memoryview(mm)[BITMAP_HEADER.size:]
+        # Buffer backed bitarrays cover whole bytes, bits past size are padding
+        self.bits = bitarray(buffer=self.view, endian="big")
+
+    @classmethod
+    def create(cls, path, size, start=0) -> "BlockBitmap":
+        """
+        Make a bitmap file of size bits and map it read/write. An existing
+        file of the same size is reused as is, so a resumed block keeps the
+        windows it already wrote.
+        :param path: File to create.
+        :param size: Bits in the block.
+        :param start: First number of the block, can be changed until flush.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        length = BITMAP_HEADER.size + cls.byte_length(size)
+        if not os.path.exists(path) or os.path.getsize(path) != length:
+            with open(path, "wb") as f:
+                f.truncate(length)
+        with open(path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        bitmap = cls(path, mm, start, size, True)
+        bitmap.write_header()
+        return bitmap
+
+    @classmethod
+    def open(cls, path, writable=False) -> "BlockBitmap":
+        """Map an existing bitmap file, read only unless writable is set."""
+        with open(path, "r+b" if writable else "rb") as f:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            mm = mmap.mmap(f.fileno(), 0, access=access)
+        magic, version, flags, start, size = BITMAP_HEADER.unpack_from(mm)
+        if magic != cls.MAGIC:
+            mm.close()
+            raise ValueError(f"{path} is not a block bitmap.")
+        return cls(path, mm, start, size, writable, bool(flags & BITMAP_COMPLETE))
+
+    @staticmethod
+    def byte_length(size) -> int:
+        """Bytes of bits for a block of size numbers."""
+        return (size + 7) // 8
+
+    def write_header(self) -> None:
+        flags = BITMAP_COMPLETE if self.complete else 0
+        self.mm[:BITMAP_HEADER.size] = BITMAP_HEADER.pack(
+            self.MAGIC, BITMAP_VERSION, flags, self.start, self.size)
+        return
+
+    def clear_padding(self) -> None:
+        """Zero the bits past size so they never read as primes."""
+        self.bits[self.size:] = False
+        return
+
+    def flush(self, complete=None) -> None:
+        """
+        Write the header and push the mapped pages to disk.
+        :param complete: Set or clear the complete flag, None leaves it.
+        """
+        if complete is not None:
+            self.complete = complete
+        if self.writable:
+            self.write_header()
+            self.mm.flush()
+        return
+
+    def close(self) -> None:
+        if self.mm is None:
+            return
+        self.flush()
+        del self.bits  # Release the buffer export before the mapping goes
+        self.view.release()
+        self.mm.close()
+        self.mm = None
+        return
+
+    def covers(self, number) -> bool:
+        return self.start <= number < self.start + self.size
+
+    def is_prime(self, number) -> bool:
+        if not self.covers(number):
+            raise ValueError(f"{number} is outside the bitmap [{self.start}, "
+                             f"{self.start + self.size}).")
+        return bool(self.bits[number - self.start])
+
+    def primes(self) -> list:
+        return list(map(add, self.bits[:self.size].search(1), repeat(self.start)))
+
+    def gaps(self) -> list:
+        """The block's gaps, the first one counted from start - 1."""
+        primes = self.primes()
+        return [p - q - 1 for p, q in zip(primes, [self.start - 1] + primes)]
+
+
+class WheelBitmap(BlockBitmap):
+    """
+    Block bitmap packed on the mod 30 wheel: one byte per 30 numbers, one
+    bit for each of the residues 1, 7, 11, 13, 17, 19, 23 and 29, so 3.75
+    times smaller than one bit per number. Byte i of the file covers
+    30 * (start // 30 + i) onwards, bits for numbers outside the block are
+    kept clear. 2, 3 and 5 have no bit and are answered directly.
+    """
+
+    MAGIC = WHEEL_MAGIC
+
+    @staticmethod
+    def byte_length(size) -> int:
+        # Enough for any start, the block may begin part way into a byte
+        return size // 30 + 2
+
+    @property
+    def origin(self) -> int:
+        """Wheel bit number of the file's first bit."""
+        return 8 * (self.start // 30)
+
+    def clear_padding(self) -> None:
+        """Zero the bits before start and from start + size on."""
+        self.bits[:wheel_bit(self.start) - self.origin] = False
+        self.bits[wheel_bit(self.start + self.size) - self.origin:] = False
+        return
+
+    def is_prime(self, number) -> bool:
+        if not self.covers(number):
+            raise ValueError(f"{number} is outside the bitmap [{self.start}, "
+                             f"{self.start + self.size}).")
+        if number in WHEEL_PRIMES:
+            return True
+        bit = number_bit(number)
+        return bit is not None and bool(self.bits[bit - self.origin])
+
+    def iter_primes(self, batch_bits=1 << 24):
+        """
+        Primes of the block in ascending lists, decoding batch_bits bits at
+        a time.
+        """
+        head = [prime for prime in WHEEL_PRIMES if self.covers(prime)]
+        if head:
+            yield head
+        end = wheel_bit(self.start + self.size) - self.origin
+        for low in range(0, end, batch_bits):
+            primes = wheel_primes(self.bits[low:min(low + batch_bits, end)], self.origin + low)
+            if primes:
+                yield primes
+
+    def primes(self) -> list:
+        return [prime for primes in self.iter_primes() for prime in primes]
+
+    def iter_gaps(self):
+        """The block's gaps in lists, the first one counted from start - 1."""
+        previous = self.start - 1
+        for primes in self.iter_primes():
+            yield [p - q - 1 for p, q in zip(primes, [previous] + primes)]
+            previous = primes[-1]
+
+    def gaps(self) -> list:
+        return [gap for gaps in self.iter_gaps() for gap in gaps]
+
+    @classmethod
+    def from_gaps(cls, path, start, size, gaps) -> "WheelBitmap":
+        """
+        Build a complete wheel bitmap from a block's gap stream.
+        :param gaps: Iterable of gaps, the first one counted from start - 1,
+                     read WHEEL_BATCH at a time.
+        """
+        bitmap = cls.create(path, size, start)
+        bitmap.bits.setall(False)
+        origin = bitmap.origin
+        primes = accumulate(map(add, gaps, repeat(1)), initial=start - 1)
+        next(primes)
+        while batch := list(islice(primes, WHEEL_BATCH)):
+            bits = [number_bit(prime) - origin for prime in batch if prime not in WHEEL_PRIMES]
+            if bits:
+                bitmap.bits[bits] = True
+        bitmap.flush(complete=True)
+        return bitmap
+
+
+if __name__ == '__main__':
+    main()
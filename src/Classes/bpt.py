@@ -0,0 +1,154 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+from math import isqrt
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.sieve import SieveProcessor
+
+# Constants
+BASE_PRIMES_FILE = "Database/base_primes.u32"  # Packed sieving primes
+TABLE_HEADER = struct.Struct("<4sIQ")  # magic, item size, highest number covered
+TABLE_MAGIC = b"BPT1"
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    table = BasePrimeTable()
+    table.build(isqrt(2**40))
+    table.open()
+    print(f"Base primes up to {table.limit:_}: {len(table.primes):_} primes, "
+          f"last {table.primes[-1]:_}")
+    table.close()
+
+    return
+
+
+class BasePrimeTable:
+    """
+    The primes used to cross off every block, stored once as a packed uint32
+    file and memory mapped read only. Every block sieve and every worker
+    process maps the same file, so the primes are shared through the page
+    cache with nothing to parse and no per process copy.
+    """
+
+    def __init__(self, path=BASE_PRIMES_FILE) -> None:
+        self.path = path
+        self.limit = None  # Highest number the table covers
+        self.primes = None  # memoryview of uint32 primes
+        self.mm = None
+
+    def build(self, limit, query=None) -> None:
+        """
+        Write the table for every prime <= limit.
+        :param limit: Highest number to cover, usually sqrt of the last block end.
+        :param query: Optional PrimeQuery. When given the primes are read from
+                      the genesis block, otherwise they are sieved here.
+        """
+        if limit >= 2**32:
+            raise ValueError("Base primes must fit in 32 bits.")
+        if query is not None:
+            primes = array("I", query.primes_between(0, limit + 1))
+        else:
+            primes = array("I", SieveProcessor.base_primes(limit))
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path + ".part", "wb") as f:
+            f.write(TABLE_HEADER.pack(TABLE_MAGIC, primes.itemsize, limit))
+            primes.tofile(f)
+        os.replace(self.path + ".part", self.path)
+        return
+
+    def extend(self, limit) -> None:
+        """
+        Grow the table to every prime <= limit without sieving again what it
+        already holds. The new range is segment sieved with the primes the
+        table has (extending to sqrt(limit) first if needed), appended to the
+        file window by window and the header is moved on last. A missing
+        table is started at sqrt(limit). The table is left open.
+        :param limit: Highest number to cover, below 2**32.
+        """
+        if limit >= 2**32:
+            raise ValueError("Base primes must fit in 32 bits.")
+        if self.primes is None:
+            if not self.exists():
+                self.build(isqrt(limit))
+            self.open()
+        if self.covers(limit):
+            return
+        root = isqrt(limit)
+        if not self.covers(root):
+            self.extend(root)
+
+        print(f"Extending base primes from {self.limit:,} to {limit:,}")
+        base = self.primes_upto(root)
+        with open(self.path, "r+b") as f:
+            # Drop anything an interrupted extend left past the header's limit
+            f.truncate(TABLE_HEADER.size + len(self.primes_upto(self.limit)) * 4)
+            f.seek(0, os.SEEK_END)
+            for primes, _ in SieveProcessor.segment_primes(self.limit + 1, limit + 1, base):
+                array("I", primes).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(TABLE_HEADER.pack(TABLE_MAGIC, 4, limit))
+        base.release()  # The mapping can only close once no slice is left
+        self.close()
+        self.open()
+        return
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def open(self) -> "BasePrimeTable":
+        """Map the table read only."""
+        with open(self.path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, itemsize, self.limit = TABLE_HEADER.unpack_from(self.mm)
+        if magic != TABLE_MAGIC or itemsize != 4:
+            raise ValueError("Not a base prime table.")
+        self.primes = memoryview(self.mm)[TABLE_HEADER.size:].cast("I")
+        return self
+
+    def close(self) -> None:
+        if self.primes is not None:
+            self.primes.release()
+            self.primes = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        return
+
+    def covers(self, number) -> bool:
+        """True if every prime <= number is in the table."""
+        return self.limit is not None and self.limit >= number
+
+    def primes_upto(self, number) -> memoryview:
+        """Zero copy slice of the primes <= number."""
+        if not self.covers(number):
+            raise ValueError(f"Base prime table only covers up to {self.limit}.")
+        return self.primes[:bisect_right(self.primes, number)]
+
+
+if __name__ == '__main__':
+    main()
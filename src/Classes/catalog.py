@@ -0,0 +1,218 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import json
+import sqlite3
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+CATALOG_FILE = "Database/catalog.sqlite3"  # Metadata of every block in one place
+CATALOG_VERSION = 3  # Bumped when the layout changes, older catalogs are rebuilt
+DETAILS = ("chunk_index", "chunk_hashes", "gap_statistics")  # Kept apart, read only on request
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS blocks (
+        filename TEXT PRIMARY KEY,
+        number INTEGER NOT NULL,
+        start_prime INTEGER NOT NULL,
+        end_prime INTEGER NOT NULL,
+        binary_file TEXT,
+        total_primes INTEGER,
+        primes_before INTEGER,
+        metadata TEXT NOT NULL,
+        structure TEXT NOT NULL,
+        json_mtime INTEGER NOT NULL,
+        json_size INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS blocks_start ON blocks (start_prime)",
+    """CREATE TABLE IF NOT EXISTS details (
+        filename TEXT PRIMARY KEY,
+        chunk_index TEXT,
+        chunk_hashes TEXT,
+        gap_statistics TEXT
+    )""",
+)
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    catalog = BlockCatalog()
+    print(f"Blocks in catalog: {len(catalog.filenames())}")
+    print(json.dumps(catalog.stats(), indent=4))
+    catalog.close()
+
+    return
+
+
+class BlockCatalog:
+    """
+    SQLite index of every block's metadata and chunk structure, without the
+    gap data. PrimeBlockManager updates it whenever a block's JSON is
+    written, so metadata lookups, finding the block for a number and
+    collection wide stats never parse the block files. SQLite takes care of
+    several worker processes writing at once.
+
+    The blocks table holds the scalar metadata and structure fields. The
+    chunk index, chunk hashes and gap statistics grow with the block, they
+    live in the details table and are only read by callers that need them.
+
+    Every entry keeps the mtime and size of the JSON file it was made from,
+    so a reader can tell an entry the JSON has moved past, e.g. a block
+    committed by a coordinator worker that does not use the catalog.
+    """
+
+    def __init__(self, path=CATALOG_FILE) -> None:
+        self.path = path
+        self.conn = None  # Opened on first use, one connection per process
+
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.conn = sqlite3.connect(self.path, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+                with self.conn:  # Older layout, the entries are made again from the JSON
+                    self.conn.execute("DROP TABLE IF EXISTS blocks")
+                    self.conn.execute("DROP TABLE IF EXISTS details")
+                    self.conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+        return self.conn
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        return
+
+    @staticmethod
+    def rows(filename, block, stamp) -> (tuple, tuple):
+        """blocks and details rows for a JSON block, everything but the gap data."""
+        metadata = dict(block["metadata"])
+        structure = dict(block["data"]["structure"])
+        details = (structure.pop("chunk_index", None), structure.pop("chunk_hashes", None),
+                   metadata.pop("gap_statistics", None))
+        return ((filename, int(filename[5:9]), metadata["start_prime"], metadata["end_prime"],
+                 block["data"].get("binary_file"), metadata.get("total_primes"),
+                 metadata.get("primes_before"), json.dumps(metadata), json.dumps(structure),
+                 *stamp),
+                (filename, *map(json.dumps, details)))
+
+    def update(self, filename, block, stamp) -> None:
+        """Add or replace the entry for one block."""
+        self.update_many([(filename, block, stamp)])
+        return
+
+    def update_many(self, blocks) -> None:
+        """
+        Add or replace several entries in one transaction.
+        :param blocks: Iterable of (filename, JSON block, (mtime_ns, size) of
+                       the JSON file the block was read from or written to).
+        """
+        rows = [self.rows(*block) for block in blocks]
+        conn = self.connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO blocks VALUES "
+                             "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [row for row, _ in rows])
+            conn.executemany("INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?)",
+                             [details for _, details in rows])
+        return
+
+    def get(self, filename) -> (dict | None, tuple | None):
+        """
+        Entry for one block, shaped like the JSON block but with only
+        metadata, data.structure and data.binary_file, and the (mtime_ns,
+        size) of the JSON file it was made from. (None, None) if not cataloged.
+        The DETAILS fields are left out, see detail.
+        """
+        found = self.connect().execute(
+            "SELECT binary_file, metadata, structure, json_mtime, json_size FROM blocks "
+            "WHERE filename = ?", (filename,)).fetchone()
+        if found is None:
+            return None, None
+        binary_file, metadata, structure, *stamp = found
+        return {
+            "metadata": json.loads(metadata),
+            "data": {"structure": json.loads(structure), "binary_file": binary_file},
+        }, tuple(stamp)
+
+    def detail(self, filename, field):
+        """One of the DETAILS fields of a block, None if not cataloged."""
+        if field not in DETAILS:
+            raise ValueError(f"Unknown catalog detail {field}.")
+        found = self.connect().execute(
+            f"SELECT {field} FROM details WHERE filename = ?", (filename,)).fetchone()
+        return None if found is None else json.loads(found[0])
+
+    def stamps(self) -> dict:
+        """filename -> (mtime_ns, size) of the JSON file each entry was made from."""
+        return {filename: (mtime, size) for filename, mtime, size in self.connect().execute(
+            "SELECT filename, json_mtime, json_size FROM blocks")}
+
+    def find_block_for(self, number) -> str | None:
+        """Filename of the block whose range holds number, None if there is none."""
+        found = self.connect().execute(
+            "SELECT filename FROM blocks WHERE start_prime <= ? AND end_prime >= ? "
+            "ORDER BY start_prime DESC LIMIT 1", (number, number)).fetchone()
+        return None if found is None else found[0]
+
+    def filenames(self) -> list:
+        return [name for name, in self.connect().execute(
+            "SELECT filename FROM blocks ORDER BY number")]
+
+    def metadata(self, sieved_only=False) -> list:
+        """Metadata of every block in order, optionally only the sieved ones."""
+        query = "SELECT metadata FROM blocks"
+        if sieved_only:
+            query += " WHERE binary_file IS NOT NULL"
+        return [json.loads(metadata) for metadata, in self.connect().execute(
+            query + " ORDER BY number")]
+
+    def stats(self) -> dict:
+        """Totals over the whole collection."""
+        sieved = [metadata for metadata in self.metadata(sieved_only=True)
+                  if metadata.get("total_primes") is not None]
+        stats = {
+            "blocks": len(self.filenames()),
+            "sieved_blocks": len(sieved),
+            "total_primes": sum(metadata["total_primes"] for metadata in sieved),
+            "highest_prime": max((metadata["last_prime"] for metadata in sieved), default=None),
+            "encoded_data_size": sum(metadata.get("encoded_data_size") or 0 for metadata in sieved),
+            "compression_size": sum(metadata.get("compression_size") or 0 for metadata in sieved),
+            "max_gap": None,
+            "start_max_gap_location": None,
+            "end_max_gap_location": None,
+            "min_gap": min((metadata["min_gap"] for metadata in sieved), default=None),
+        }
+        if sieved:
+            widest = max(sieved, key=lambda metadata: metadata["max_gap"])
+            for key in ("max_gap", "start_max_gap_location", "end_max_gap_location"):
+                stats[key] = widest[key]
+        return stats
+
+    def clear(self) -> None:
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM blocks")
+            conn.execute("DELETE FROM details")
+        return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from math import isqrt
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.bpt import BasePrimeTable
+from Classes.pbm import PrimeBlockManager, BIN_DIR, JSON_DIR
+from Classes.query import PrimeQuery
+from Classes.scheduler import GENESIS_FILE, block_metrics
+from Classes.sieve import SieveProcessor
+
+# Constants
+LEASE_DIR = JSON_DIR + "/leases"  # Lease and done files shared by every worker
+LEASE_TTL = 120.0  # Seconds without a heartbeat before a lease can be taken over
+POLL_INTERVAL = 5.0  # Seconds to wait when every pending block is held by someone
+PRIME_COUNTS = "prime_counts"  # Lease name guarding update_prime_counts
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    # Start this in several shells (or on several hosts sharing Database) and
+    # every block is sieved exactly once.
+    coordinator = BlockCoordinator(PrimeBlockManager(block_size=2**24, total_blocks=8,
+                                                     use_catalog=False))
+    coordinator.run()
+    print(json.dumps(coordinator.status(), indent=4))
+
+    return
+
+
+class LeaseLost(RuntimeError):
+    """The lease expired and another worker took the block over."""
+
+
+class BlockLease:
+    """
+    One claimed lease file. The file's mtime is the heartbeat: a background
+    thread touches it every interval while the block is worked on. The
+    token written at claim time tells whether the file is still ours.
+    """
+
+    def __init__(self, name, path, token) -> None:
+        self.name = name
+        self.path = path
+        self.token = token
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def owner(self) -> str | None:
+        """Token of the current lease file, None if there is none or it is being written."""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)["token"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def renew(self) -> bool:
+        """Touch the lease if it is still ours."""
+        if self.owner() != self.token:
+            return False
+        os.utime(self.path)
+        return True
+
+    def start(self, interval) -> None:
+        self.thread = threading.Thread(target=self.beat, args=(interval,),
+                                       name=f"lease-{self.name}", daemon=True)
+        self.thread.start()
+        return
+
+    def beat(self, interval) -> None:
+        while not self.stopped.wait(interval):
+            if not self.renew():
+                self.lost = True
+                return
+
+    def check(self) -> None:
+        """Raise LeaseLost unless the lease is still ours, renewing it on the way."""
+        if self.lost or not self.renew():
+            self.lost = True
+            raise LeaseLost(f"Lease on {self.name} was taken over.")
+        return
+
+    def release(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if not self.lost and self.owner() == self.token:
+            os.unlink(self.path)
+        return
+
+
+class BlockCoordinator:
+    """
+    Lets any number of worker processes, on one host or several sharing the
+    Database directory, sieve the 2_32-NNNN blocks with no central service.
+
+    A worker claims a block by creating its lease file with O_CREAT | O_EXCL,
+    which only one worker can win. Leases are kept alive by heartbeats and a
+    lease without one for ttl seconds is taken over, so the blocks of a dead
+    worker go back into the pool. A finished block is committed through the
+    usual .part files and atomic renames, then a .done file is renamed into
+    place and the lease dropped. Status is read from the lease directory.
+
+    Genesis goes first: its holder sieves it and builds the base prime
+    table, the other workers wait for its .done file.
+
+    Block state is read from and written to the JSON files alone. The SQLite
+    catalog is left out, its WAL mode can't be shared between hosts over NFS,
+    so a PrimeBlockManager handed in with one has it dropped.
+    """
+
+    def __init__(self, pbm, worker_id=None, ttl=LEASE_TTL, lease_dir=LEASE_DIR,
+                 poll_interval=POLL_INTERVAL) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        if pbm.catalog is not None:
+            pbm.catalog.close()
+            pbm.catalog = None
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.lease_dir = lease_dir
+        self.poll_interval = poll_interval
+
+    def lease_path(self, name) -> str:
+        return os.path.join(self.lease_dir, os.path.splitext(name)[0] + ".lease")
+
+    def done_path(self, name) -> str:
+        return os.path.join(self.lease_dir, os.path.splitext(name)[0] + ".done")
+
+    def is_done(self, filename) -> bool:
+        return os.path.exists(self.done_path(filename))
+
+    def expired(self, path) -> bool:
+        return time.time() - os.stat(path).st_mtime > self.ttl
+
+    def claim(self, name) -> BlockLease | None:
+        """
+        Try to take the lease on name, taking over an expired one.
+        :return: The running BlockLease, None if another worker holds it.
+        """
+        if not os.path.exists(self.lease_dir):
+            os.makedirs(self.lease_dir, exist_ok=True)
+        path = self.lease_path(name)
+        token = uuid.uuid4().hex
+        for attempt in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if attempt or not self.reclaim(name, path):
+                    return None
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"worker": self.worker_id, "token": token,
+                           "claimed": time.time()}, f)
+            lease = BlockLease(name, path, token)
+            lease.start(self.ttl / 4)
+            return lease
+        return None
+
+    def reclaim(self, name, path) -> bool:
+        """
+        Remove an expired lease so it can be claimed again. The file is first
+        renamed to a name of our own, only one worker can win that rename.
+        If the lease turns out to have been renewed in between it is put back.
+        :return: True if the lease is gone.
+        """
+        try:
+            if not self.expired(path):
+                return False
+            stale = f"{path}.{uuid.uuid4().hex}.stale"
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return True  # Released or taken over by someone else meanwhile
+        if not self.expired(stale):
+            try:
+                os.link(stale, path)
+            except FileExistsError:
+                pass
+            os.unlink(stale)
+            return False
+        try:
+            with open(stale, "r") as f:
+                self.remove_parts(name, json.load(f)["worker"])
+        except (ValueError, KeyError):
+            pass  # Died before writing the lease, it wrote nothing else either
+        os.unlink(stale)
+        print(f"{self.worker_id}: took over the expired lease on {name}")
+        return True
+
+    @staticmethod
+    def remove_parts(name, worker) -> None:
+        """Delete the unfinished .bin and JSON files a dead worker left for block name."""
+        base = os.path.join(BIN_DIR, PrimeBlockManager.bin_filename(name) + f".{worker}")
+        json_part = os.path.join(JSON_DIR, f"{name}.{worker}.part")  # See save_block_json
+        for part in (base + ".part", base + ".cpart", json_part):
+            if os.path.exists(part):
+                os.remove(part)
+        return
+
+    def mark_done(self, filename, metadata) -> None:
+        """Publish that filename is finished, the .done file appears whole or not at all."""
+        path = self.done_path(filename)
+        part = f"{path}.{self.worker_id}.part"
+        with open(part, "w") as f:
+            json.dump({"worker": self.worker_id, "finished": time.time(),
+                       "last_prime": metadata.get("last_prime"),
+                       "total_primes": metadata.get("total_primes")}, f)
+        os.replace(part, path)
+        return
+
+    def committed(self, filename) -> dict | None:
+        """Metadata of a block that is already in its JSON, None if it is not."""
+        if not os.path.exists(os.path.join(JSON_DIR, filename)):
+            return None
+        block = self.pbm.load_block(filename)
+        return block["metadata"] if block["data"].get("binary_file") else None
+
+    def sieve(self, filename, lease) -> dict:
+        """Sieve and commit one block while holding its lease."""
+        start = int(filename[5:9]) * self.pbm.block_size
+        table = BasePrimeTable().open() if start else None  # Built with genesis
+        writer = self.pbm.open_writer(filename, start, tag=self.worker_id)
+        sieve = SieveProcessor(limit=self.pbm.block_size, pbm=self.pbm, bpt=table,
+                               metrics=block_metrics(filename))
+        if table is None:
+            sieve.genesis_sieve(writer)
+        else:
+            sieve.sieve(None, start, writer)
+            table.close()
+        try:
+            lease.check()  # Never commit a block another worker has taken over
+        except LeaseLost:
+            writer.file.close()
+            os.remove(writer.part)
+            raise
+        self.pbm.commit_block(filename, writer, sieve.metadata)
+        return sieve.metadata
+
+    def work(self, filename, lease) -> None:
+        """Finish one claimed block, or just publish it if an earlier holder committed it."""
+        try:
+            metadata = self.committed(filename)
+            if metadata is None:
+                if filename == GENESIS_FILE and not self.pbm.list_blocks():
+                    self.pbm.create_blank_blocks()
+                metadata = self.sieve(filename, lease)
+            if filename == GENESIS_FILE:
+                last_end = self.pbm.total_blocks * self.pbm.block_size - 1
+                BasePrimeTable().build(isqrt(last_end), PrimeQuery(self.pbm))
+            lease.check()
+            self.mark_done(filename, metadata)
+            print(f"{self.worker_id}: completed {filename} - "
+                  f"Last prime: {metadata['last_prime']:,}")
+        except LeaseLost as error:
+            print(f"{self.worker_id}: {error} Dropping it.")
+        finally:
+            lease.release()
+        self.update_prime_counts()
+        return
+
+    def update_prime_counts(self) -> None:
+        """Refresh primes_before unless another worker is already doing it."""
+        lease = self.claim(PRIME_COUNTS)
+        if lease is not None:
+            try:
+                self.pbm.block_names = None  # Other workers may have added blocks
+                self.pbm.update_prime_counts()
+            finally:
+                lease.release()
+        return
+
+    def pending(self) -> list:
+        return [f for f in self.pbm.scan_blocks() if f != GENESIS_FILE and not self.is_done(f)]
+
+    def run(self, max_blocks=None) -> int:
+        """
+        Claim and sieve blocks until none are left.
+        :param max_blocks: Stop after this many blocks, None for no limit.
+        :return: Blocks this worker completed.
+        """
+        completed = 0
+        while max_blocks is None or completed < max_blocks:
+            if not self.is_done(GENESIS_FILE):
+                lease = self.claim(GENESIS_FILE)
+                if lease is None:
+                    time.sleep(self.poll_interval)
+                else:
+                    self.work(GENESIS_FILE, lease)
+                    completed += 1
+                continue
+
+            pending = self.pending()
+            if not pending:
+                break
+            for filename in pending:
+                lease = self.claim(filename)
+                if lease is not None:
+                    break
+            else:
+                time.sleep(self.poll_interval)  # All held, some may expire
+                continue
+            if self.is_done(filename):
+                lease.release()  # Finished between listing and claiming
+                continue
+            self.work(filename, lease)
+            completed += 1
+        return completed
+
+    def status(self) -> dict:
+        """Collection wide progress, read from the lease directory alone."""
+        blocks = self.pbm.scan_blocks()
+        status = {"blocks": len(blocks), "done": 0, "pending": 0, "held": {}, "expired": []}
+        for filename in blocks:
+            if self.is_done(filename):
+                status["done"] += 1
+                continue
+            status["pending"] += 1
+            path = self.lease_path(filename)
+            try:
+                if self.expired(path):
+                    status["expired"].append(filename)
+                    continue
+                with open(path, "r") as f:
+                    status["held"][filename] = json.load(f)["worker"]
+            except FileNotFoundError:
+                continue
+            except (ValueError, KeyError):
+                status["held"][filename] = None  # Lease being written
+        return status
+
+
+if __name__ == '__main__':
+    main()
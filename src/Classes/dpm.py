@@ -19,9 +19,15 @@ from datetime import datetime
 # Third-Party Imports
 
 # Local Imports
+from Classes.pbm import PrimeBlockManager
 
 # Constants
 JSON_DIR = "Database/json_blocks"  # Directory to store JSON files
+COMPACT_EVERY = 256  # Journal records before they are folded into a snapshot
+GROWING_LISTS = (  # Checkpoint lists that grow with the block, journaled as what changed
+    ("writer", "chunk_index"),
+    ("gap_state", "statistics", "chunks"),
+)
 
 
 def main() -> None:
@@ -37,9 +43,54 @@ def main() -> None:
     return
 
 
+def split_lists(checkpoint, previous) -> dict:
+    """
+    checkpoint with every GROWING_LISTS list cut down to the entries that
+    differ from previous, plus the position they start at under key_from.
+    """
+    delta = dict(checkpoint)
+    for *path, key in GROWING_LISTS:
+        parent, old = delta, previous
+        for name in path:
+            if not isinstance(parent.get(name), dict):
+                break
+            parent[name] = parent = dict(parent[name])
+            old = old.get(name) if isinstance(old, dict) else None
+        else:
+            if key in parent:
+                old = (old.get(key) or []) if isinstance(old, dict) else []
+                new = parent[key]
+                start = 0
+                while start < min(len(old), len(new)) and old[start] == new[start]:
+                    start += 1
+                parent[key] = new[start:]
+                parent[key + "_from"] = start
+    return delta
+
+
+def join_lists(delta, previous) -> dict:
+    """Undo split_lists, the full checkpoint from a journaled one and the one before it."""
+    checkpoint = dict(delta)
+    for *path, key in GROWING_LISTS:
+        parent, old = checkpoint, previous
+        for name in path:
+            if not isinstance(parent.get(name), dict):
+                break
+            parent[name] = parent = dict(parent[name])
+            old = old.get(name) if isinstance(old, dict) else None
+        else:
+            start = parent.pop(key + "_from", None)
+            if start is not None:  # Older records hold the whole list
+                old = (old.get(key) or []) if isinstance(old, dict) else []
+                parent[key] = old[:start] + parent[key]
+    return checkpoint
+
+
 class ProgressManager:
     def __init__(self, progress_file):
         self.progress_file = progress_file
+        self.journal_file = progress_file + ".journal"  # Changes since the snapshot
+        self.journal_records = 0
         self.file_not_created = False
         self.progress_data = {
             "status": {
@@ -68,6 +119,8 @@ class ProgressManager:
                 "notes": "Resumes from last checkpoint."
             },
             "file_list": {},
+            "metrics": {},
+            "journal_sequence": 0,  # Sequence number of the last record in the snapshot
         }
 
     @staticmethod
@@ -75,50 +128,205 @@ class ProgressManager:
         return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
 
     def save_progress(self):
+        """
+        Write a full snapshot of progress_data and empty the journal. The
+        snapshot goes to a temp file that is renamed over the old one, so a
+        crash leaves either the old or the new snapshot, never half of one.
+        """
         self.progress_data["status"]["timestamp"] = self.get_timestamp()
         self.progress_data["system_info"]["last_updated"] = self.get_timestamp()
-        with open(self.progress_file, 'w') as file:
+        temp_file = self.progress_file + ".tmp"
+        directory = os.path.dirname(self.progress_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(temp_file, 'w') as file:
             json.dump(self.progress_data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.progress_file)
+        with open(self.journal_file, 'w'):
+            pass
+        self.journal_records = 0
         self.file_not_created = True
 
     def load_progress(self):
+        """
+        Load the last snapshot, then replay the journal written after it and
+        fold it into a new snapshot.
+        """
+        replayed = self.read_progress()
+        if replayed is None:
+            print("Progress file not found. Starting fresh.")
+            self.save_progress()
+        elif replayed:
+            self.save_progress()
+
+    def read_progress(self):
+        """
+        Load the last snapshot and replay the journal onto it without writing
+        anything, so the current state can be read while a sieve is running.
+        :return: Number of journal records replayed, None if there is no snapshot.
+        """
         try:
             with open(self.progress_file, 'r') as file:
                 self.progress_data = json.load(file)
         except FileNotFoundError:
-            print("Progress file not found. Starting fresh.")
+            return None
+        return self.replay_journal()
+
+    def replay_journal(self):
+        """
+        Apply the journal records the snapshot does not hold yet, without
+        writing anything. A crash between saving a snapshot and emptying
+        the journal leaves records the snapshot already has, they are
+        recognised by their sequence number and skipped.
+        :return: Number of records applied.
+        """
+        replayed = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn last record from a crash mid write
+                    if record.get("seq", 0) and \
+                            record["seq"] <= self.progress_data.get("journal_sequence", 0):
+                        continue
+                    self.apply_record(record)
+                    replayed += 1
+        return replayed
+
+    def append_record(self, record):
+        """
+        Apply one state change and append it to the journal. Each record is a
+        single JSON line flushed to disk, so a checkpoint costs the same no
+        matter how many blocks file_list holds. Every COMPACT_EVERY records
+        the journal is folded into a new snapshot.
+        """
+        record["timestamp"] = self.get_timestamp()
+        record["seq"] = self.progress_data.get("journal_sequence", 0) + 1
+        self.apply_record(record)
+        with open(self.journal_file, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.journal_records += 1
+        if self.journal_records >= COMPACT_EVERY:
             self.save_progress()
 
+    def apply_record(self, record):
+        """Change progress_data for one journal record."""
+        status = self.progress_data["status"]
+        sieve_metadata = self.progress_data["sieve_metadata"]
+        op = record["op"]
+
+        if op == "genesis":
+            status["genesis_completed"] = record["completed"]
+            sieve_metadata["genesis"]["completed"] = record["completed"]
+            sieve_metadata["genesis"]["last_prime_processed"] = record["last_prime"]
+            if record["completed"]:
+                sieve_metadata["genesis"].pop("checkpoint", None)
+                self.progress_data["file_list"][sieve_metadata["genesis"]["file_name"]] = True
+        elif op == "checkpoint":
+            entry = self.progress_entry(record["file_name"])
+            if entry is not None:
+                entry["last_prime_processed"] = record["checkpoint"]["gap_state"]["last_prime"]
+                entry["checkpoint"] = join_lists(record["checkpoint"], entry.get("checkpoint"))
+        elif op == "settings":
+            self.progress_data["settings"]["max_parallel_files"] = record["max_parallel_files"]
+        elif op == "metrics":
+            self.progress_data.setdefault("metrics", {})[record["file_name"]] = record["metrics"]
+        elif op == "add":
+            if record["file_name"] not in status["files_in_progress"]:
+                sieve_metadata["in_progress"].append({
+                    "file_name": record["file_name"],
+                    "start_prime": record["start_prime"],
+                    "last_prime_processed": record["last_prime"]
+                })
+        elif op == "complete":
+            sieve_metadata["in_progress"] = [
+                f for f in sieve_metadata["in_progress"] if
+                f["file_name"] != record["file_name"]
+            ]
+            status["total_completed_files"] += 1
+            self.progress_data["file_list"][record["file_name"]] = True
+
+        status["files_in_progress"] = [
+            f["file_name"] for f in sieve_metadata["in_progress"]
+        ]
+        status["timestamp"] = record["timestamp"]
+        self.progress_data["system_info"]["last_updated"] = record["timestamp"]
+        if record.get("seq"):
+            self.progress_data["journal_sequence"] = record["seq"]
+
+    def progress_entry(self, file_name):
+        """The genesis or in progress entry for file_name, None if not running."""
+        genesis = self.progress_data["sieve_metadata"]["genesis"]
+        if file_name == genesis["file_name"]:
+            return None if genesis["completed"] else genesis
+        for entry in self.progress_data["sieve_metadata"]["in_progress"]:
+            if entry["file_name"] == file_name:
+                return entry
+        return None
+
+    def get_checkpoint(self, file_name):
+        """Last saved mid block checkpoint for file_name, or None."""
+        entry = self.progress_entry(file_name)
+        return None if entry is None else entry.get("checkpoint")
+
+    def save_checkpoint(self, file_name, checkpoint):
+        """
+        Record how far a running block has been sieved and written. Only the
+        GROWING_LISTS entries added since the last checkpoint are journaled,
+        so a record stays the same size however far the block has come.
+        """
+        entry = self.progress_entry(file_name)
+        self.append_record({
+            "op": "checkpoint",
+            "file_name": file_name,
+            "checkpoint": split_lists(checkpoint, None if entry is None else entry.get("checkpoint"))
+        })
+
+    def record_metrics(self, file_name, snapshot):
+        """Keep the latest SieveMetrics snapshot of a block, usable as a metrics callback."""
+        self.append_record({
+            "op": "metrics",
+            "file_name": file_name,
+            "metrics": snapshot
+        })
+
     def update_genesis(self, completed, last_prime=None):
-        self.progress_data["sieve_metadata"]["genesis"]["completed"] = completed
-        self.progress_data["sieve_metadata"]["genesis"][
-            "last_prime_processed"] = last_prime
-        self.save_progress()
+        self.append_record({
+            "op": "genesis",
+            "completed": completed,
+            "last_prime": last_prime
+        })
+
+    def set_max_parallel_files(self, count):
+        """Change how many blocks can be in progress at once."""
+        self.append_record({"op": "settings", "max_parallel_files": count})
 
     def add_in_progress_file(self, file_name, start_prime, last_prime=None):
-        if len(self.progress_data["status"]["files_in_progress"]) < \
-                self.progress_data["settings"]["max_parallel_files"]:
-            self.progress_data["sieve_metadata"]["in_progress"].append({
-                "file_name": file_name,
-                "start_prime": start_prime,
-                "last_prime_processed": last_prime
-            })
-            self.progress_data["status"]["files_in_progress"] = [
-                f["file_name"] for f in
-                self.progress_data["sieve_metadata"]["in_progress"]
-            ]
-            self.save_progress()
+        """
+        Start tracking a running block so its checkpoints are kept. Raises
+        RuntimeError when settings.max_parallel_files other blocks already
+        are, a block without an entry would lose every checkpoint.
+        """
+        in_progress = self.progress_data["status"]["files_in_progress"]
+        limit = self.progress_data["settings"]["max_parallel_files"]
+        if file_name not in in_progress and len(in_progress) >= limit:
+            raise RuntimeError(f"Cannot track {file_name}, {len(in_progress)} blocks are "
+                               f"already in progress and max_parallel_files is {limit}.")
+        self.append_record({
+            "op": "add",
+            "file_name": file_name,
+            "start_prime": start_prime,
+            "last_prime": last_prime
+        })
 
     def mark_file_complete(self, file_name):
-        self.progress_data["sieve_metadata"]["in_progress"] = [
-            f for f in self.progress_data["sieve_metadata"]["in_progress"] if
-            f["file_name"] != file_name
-        ]
-        self.progress_data["status"]["files_in_progress"] = [
-            f["file_name"] for f in self.progress_data["sieve_metadata"]["in_progress"]
-        ]
-        self.progress_data["status"]["total_completed_files"] += 1
-        self.save_progress()
+        self.append_record({"op": "complete", "file_name": file_name})
 
     def print_summary(self):
         """Prints a summary of the JSON file data."""
@@ -127,8 +335,7 @@ class ProgressManager:
     @staticmethod
     def list_blocks() -> list:
         """List all block files in the directory."""
-        return sorted([f for f in os.listdir(JSON_DIR) if f.endswith(".json") and
-                       "2_32" in f])
+        return PrimeBlockManager.scan_blocks()
 
 
 if __name__ == '__main__':
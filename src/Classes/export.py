@@ -0,0 +1,157 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import sys
+import mmap
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.pbm import PrimeBlockManager
+from Classes.query import PrimeQuery
+
+# Constants
+EXPORT_FORMATS = ("npy", "u64")
+EXPORT_WORKERS = os.cpu_count() or 1  # Processes decoding chunks
+NPY_MAGIC = b"\x93NUMPY"
+NPY_ALIGN = 64  # The .npy data starts on a multiple of this
+PRIME_BYTES = 8  # Every prime is written as a little endian uint64
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    exporter = PrimeExporter(PrimeBlockManager())
+    count = exporter.export_primes(0, 10**8, "primes_below_1e8.npy")
+    print(f"Exported {count:_} primes to primes_below_1e8.npy")
+
+    return
+
+
+def npy_header(count) -> bytes:
+    """
+    Header of a version 1.0 .npy file holding count little endian uint64s,
+    so numpy.load or numpy.memmap can open the export without NumPy being
+    needed here.
+    """
+    header = f"{{'descr': '<u8', 'fortran_order': False, 'shape': ({count},), }}"
+    size = len(NPY_MAGIC) + 2 + 2 + len(header) + 1
+    header += " " * (-size % NPY_ALIGN) + "\n"
+    return NPY_MAGIC + bytes((1, 0)) + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+
+def decode_chunk(task) -> int:
+    """
+    Decode one chunk of a .bin block and write its primes in [low, high)
+    into the output file at byte position. Runs in a worker process.
+    :param task: (PrimeBlockManager.chunk_frame of the chunk, low, high,
+                  output path, position)
+    :return: Number of primes written.
+    """
+    frame, low, high, out_path, position = task
+    primes = PrimeBlockManager.decode_frame(*frame)
+    del primes[bisect_left(primes, high):]
+    del primes[:bisect_left(primes, low)]
+    if not primes:
+        return 0
+    if sys.byteorder != "little":
+        primes.byteswap()
+
+    data = memoryview(primes).cast("B")
+    base = position - position % mmap.ALLOCATIONGRANULARITY
+    with open(out_path, "r+b") as f, \
+            mmap.mmap(f.fileno(), position + len(data) - base, offset=base) as out:
+        out[position - base:] = data
+    return len(primes)
+
+
+class PrimeExporter:
+    """
+    Writes the stored primes of any range to a flat uint64 file, a .npy
+    array or raw little endian words, for NumPy or Arrow jobs to map.
+
+    The output size is known before anything is decoded: the chunk index of
+    every .bin block holds the first prime and the count of primes before
+    each chunk, so every chunk's place in the output follows from the
+    stored counts. The file is preallocated and the chunks are decoded in
+    parallel across a process pool, each worker writing its primes straight
+    into its own slice of the mapped file.
+    """
+
+    def __init__(self, pbm, workers=EXPORT_WORKERS, query=None) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.workers = workers
+        self.query = query or PrimeQuery(pbm)
+
+    def chunk_tasks(self, start, stop, out_path, data_offset) -> list:
+        """
+        One decode_chunk task for every stored chunk holding primes in
+        [start, stop). Raises ValueError if a block in the range is not sieved.
+        """
+        first_count = self.query.prime_pi(start - 1)
+        tasks = []
+        for number in range(start // self.pbm.block_size, (stop - 1) // self.pbm.block_size + 1):
+            filename = PrimeQuery.block_filename(number)
+            block = self.query.block(filename)
+            structure = block["data"]["structure"]
+            index = structure["chunk_index"]
+            before = self.query.primes_before(number)
+            block_start = block["metadata"]["start_prime"]
+            first = max(start - block_start, 0) // structure["chunk_size"]
+            for k in range(first, len(index)):
+                prime, _, count = index[k]
+                if prime is None or prime >= stop:
+                    break
+                low = max(start, block_start + k * structure["chunk_size"])
+                position = max(before + count - first_count, 0)
+                tasks.append((self.pbm.chunk_frame(block, k), low, stop, out_path,
+                              data_offset + PRIME_BYTES * position))
+        return tasks
+
+    def export_primes(self, start, stop, out_path, fmt="npy") -> int:
+        """
+        Write the primes p with start <= p < stop to out_path.
+        :param fmt: "npy" for a .npy array of uint64, "u64" for the bare
+                    little endian uint64 words.
+        :return: Number of primes written.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {fmt}.")
+        start = max(start, 0)
+        count = self.query.count_primes(start, stop)
+        header = npy_header(count) if fmt == "npy" else b""
+        size = len(header) + PRIME_BYTES * count
+        tasks = self.chunk_tasks(start, stop, out_path, len(header)) if count else []
+
+        with open(out_path, "wb") as f:
+            f.write(header)
+            f.truncate(size)
+            if hasattr(os, "posix_fallocate") and size:
+                os.posix_fallocate(f.fileno(), 0, size)
+
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+                written = sum(pool.map(decode_chunk, tasks, chunksize=4))
+        else:
+            written = sum(map(decode_chunk, tasks))
+        if written != count:
+            raise ValueError(f"Wrote {written:,} primes to {out_path}, the stored "
+                             f"counts say {count:,}.")
+        return count
+
+
+if __name__ == '__main__':
+    main()
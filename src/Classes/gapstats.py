@@ -0,0 +1,321 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import re
+import json
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from itertools import compress, repeat
+from operator import lt, mul
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+TOP_GAPS = 16  # Largest gaps kept with their location
+# Runs of consecutive gaps (composites between neighbouring primes) that
+# make up each constellation, counted once per first prime. A pair p, p + 6
+# with a prime in between shows up as two gaps. (1, 1) is only 3, 5, 7.
+CONSTELLATIONS = {
+    "twin": ((1,),),                                # p, p + 2
+    "cousin": ((3,), (1, 1)),                       # p, p + 4
+    "sexy": ((5,), (1, 3), (3, 1)),                 # p, p + 6
+    "triplet": ((1, 3), (3, 1)),                    # p, p + 2, p + 6 / p, p + 4, p + 6
+    "quadruplet": ((1, 3, 1),),                     # p, p + 2, p + 6, p + 8
+    "quintuplet": ((1, 3, 1, 3), (3, 1, 3, 1)),     # spanning 12
+    "sextuplet": ((3, 1, 3, 1, 3),),                # p, p + 4, ..., p + 16
+}
+# Gaps are matched as bytes, one per gap with wide gaps cut to 255. The
+# alternatives of a constellation never match at the same prime.
+RUNS = {name: tuple(bytes(run) for run in runs) for name, runs in CONSTELLATIONS.items()}
+# Lookahead patterns also count matches overlapping each other. That only
+# happens among the primes up to 23, such as the quadruplets at 5 and 11:
+# a longer chain of the same run always has a multiple of 5 in it. Past
+# OVERLAP_LIMIT the much faster bytes.count is exact.
+PATTERNS = {name: re.compile(b"(?=" + b"|".join(map(re.escape, runs)) + b")")
+            for name, runs in RUNS.items()}
+OVERLAP_LIMIT = 100
+CARRY = max(len(run) for runs in RUNS.values() for run in runs) - 1
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71]
+    gaps = [prime - previous - 1 for previous, prime in zip([-1] + primes, primes)]
+    low = GapStatistics(0)
+    low.add(primes[:8], gaps[:8])
+    low.finish(20)
+    high = GapStatistics(21)
+    high.add(primes[8:], [primes[8] - 21] + gaps[9:])
+    high.finish(71)
+    print(json.dumps(low.merge(high).summary(), indent=4))
+
+    return
+
+
+def count_runs(name, text, exact=False) -> int:
+    """Matches of a constellation in text, see OVERLAP_LIMIT for exact."""
+    if exact:
+        return len(PATTERNS[name].findall(text))
+    return sum(map(text.count, RUNS[name]))
+
+
+def gap_bytes(gaps, max_gap) -> bytes:
+    """One byte per gap for matching, gaps past 255 become 255."""
+    return bytes(gaps) if max_gap < 256 else bytes(map(min, gaps, repeat(255)))
+
+
+class GapStatistics:
+    """
+    Gap statistics of one block, gathered while it is sieved so no second
+    pass over the stored gaps is needed: a histogram of every gap, the
+    TOP_GAPS largest gaps, the maximal gap records (gaps wider than every
+    gap before them) and counts of the prime constellations. Every window
+    is handled with bulk reductions over its gap list.
+
+    Gaps are counted the way the blocks store them, the composites between
+    two primes, one less than their difference. Locations are the prime
+    before the gap. The first gap a block stores is counted from its start
+    and is left out. The gap between two blocks is added back by merge,
+    which also counts the constellations crossing the boundary. This way
+    the statistics of consecutive blocks combine into those of the whole
+    range without decoding either block.
+
+    With a chunk_size the gaps are also summed up per chunk of the block,
+    as [gaps, gap sum, max gap, its location, twins] under the chunk of
+    the prime after each gap.
+    """
+
+    def __init__(self, start, chunk_size=None, top=TOP_GAPS) -> None:
+        self.start = start  # First number covered
+        self.end = None  # Last number covered, set by finish
+        self.chunk_size = chunk_size
+        self.top_size = top
+        self.first_prime = None
+        self.last_prime = None
+        self.total_gaps = 0
+        self.gap_sum = 0
+        self.histogram = Counter()
+        self.top = []  # Min heap of (gap, location)
+        self.records = []  # [gap, location] in ascending order
+        self.constellations = dict.fromkeys(CONSTELLATIONS, 0)
+        self.head = b""  # First CARRY gaps, see gap_bytes
+        self.tail = b""  # Last CARRY gaps
+        self.chunks = []
+
+    def add(self, primes, gaps) -> None:
+        """
+        Count the next primes of the block and the gaps before them.
+        :param primes: Ascending primes following the ones added before.
+        :param gaps: gaps[i] is the gap before primes[i].
+        """
+        if not primes:
+            return
+        if self.first_prime is None:
+            self.first_prime = self.last_prime = primes[0]
+            primes, gaps = primes[1:], gaps[1:]  # The first gap reaches back to start
+            if not primes:
+                return
+        if not self.chunk_size:
+            self.add_run(primes, gaps, None)
+            return
+
+        first = (primes[0] - self.start) // self.chunk_size
+        last = (primes[-1] - self.start) // self.chunk_size
+        if first == last:
+            self.add_run(primes, gaps, first)
+            return
+        pos = 0
+        for chunk in range(first, last + 1):
+            end = bisect_left(primes, self.start + (chunk + 1) * self.chunk_size, pos)
+            if end > pos:
+                self.add_run(primes[pos:end], gaps[pos:end], chunk)
+            pos = end
+        return
+
+    def add_run(self, primes, gaps, chunk) -> None:
+        """Count primes that all fall in one chunk (None without chunks)."""
+        previous = self.last_prime
+        size = len(gaps)
+        counted = Counter(gaps)  # Sum and max come from its few distinct gaps
+        gap_sum = sum(map(mul, counted.keys(), counted.values()))
+        max_gap = max(counted)
+        self.total_gaps += size
+        self.gap_sum += gap_sum
+        self.histogram.update(counted)
+
+        # Largest gaps, only the ones wider than the smallest kept are looked at
+        if len(self.top) >= self.top_size:
+            threshold = self.top[0][0]
+        else:
+            threshold = heapq.nlargest(self.top_size, gaps)[-1] - 1
+        if max_gap > threshold:
+            for pos in compress(range(size), map(lt, repeat(threshold), gaps)):
+                item = (gaps[pos], primes[pos - 1] if pos else previous)
+                if len(self.top) < self.top_size:
+                    heapq.heappush(self.top, item)
+                elif item[0] > self.top[0][0]:
+                    heapq.heapreplace(self.top, item)
+
+        # Maximal gap records
+        widest = self.records[-1][0] if self.records else -1
+        if max_gap > widest:
+            for pos in compress(range(size), map(lt, repeat(widest), gaps)):
+                if gaps[pos] > widest:
+                    widest = gaps[pos]
+                    self.records.append([widest, primes[pos - 1] if pos else previous])
+
+        # Matches that started in the gaps before this run are counted now
+        text = self.tail + gap_bytes(gaps, max_gap)
+        exact = previous < OVERLAP_LIMIT
+        counts = {name: count_runs(name, text, exact) - count_runs(name, self.tail, exact)
+                  for name in RUNS}
+        for name, count in counts.items():
+            self.constellations[name] += count
+        if len(self.head) < CARRY:
+            self.head = text[:CARRY]  # The tail is the head so far
+        self.tail = text[-CARRY:]
+
+        if chunk is not None:
+            self.chunks.extend([None] * (chunk + 1 - len(self.chunks)))
+            pos = gaps.index(max_gap)
+            location = primes[pos - 1] if pos else previous
+            entry = self.chunks[chunk]
+            if entry is None:
+                self.chunks[chunk] = [size, gap_sum, max_gap, location, counts["twin"]]
+            else:
+                entry[0] += size
+                entry[1] += gap_sum
+                if max_gap > entry[2]:
+                    entry[2], entry[3] = max_gap, location
+                entry[4] += counts["twin"]
+        self.last_prime = primes[-1]
+        return
+
+    def finish(self, end) -> None:
+        """Close the block at end, its last number."""
+        self.end = end
+        return
+
+    @property
+    def average_gap(self) -> float | None:
+        return self.gap_sum / self.total_gaps if self.total_gaps else None
+
+    def merge(self, other) -> "GapStatistics":
+        """
+        Append the statistics of the block right after this one, including
+        the gap and the constellations across the boundary between them.
+        Chunk entries belong to single blocks and are dropped.
+        :param other: Finished GapStatistics starting at self.end + 1.
+        :return: self
+        """
+        if self.end is None or other.start != self.end + 1:
+            raise ValueError(f"Block at {other.start:,} does not follow the one ending "
+                             f"at {self.end}.")
+        if other.first_prime is not None:
+            if self.last_prime is None:
+                self.first_prime = other.first_prime
+            else:
+                gap = other.first_prime - self.last_prime - 1
+                location = self.last_prime
+                self.total_gaps += 1
+                self.gap_sum += gap
+                self.histogram[gap] += 1
+                self.top.append((gap, location))
+                if not self.records or gap > self.records[-1][0]:
+                    self.records.append([gap, location])
+                text = self.tail + gap_bytes([gap], gap) + other.head
+                for name in RUNS:
+                    self.constellations[name] += count_runs(name, text, True) - \
+                        count_runs(name, self.tail, True) - count_runs(name, other.head, True)
+                if len(self.head) < CARRY:
+                    self.head = (self.head + gap_bytes([gap], gap) + other.head)[:CARRY]
+                self.tail = (self.tail + gap_bytes([gap], gap) + other.tail)[-CARRY:]
+            self.last_prime = other.last_prime
+
+        self.total_gaps += other.total_gaps
+        self.gap_sum += other.gap_sum
+        self.histogram.update(other.histogram)
+        self.top = heapq.nlargest(self.top_size, self.top + other.top)
+        heapq.heapify(self.top)
+        for gap, location in other.records:
+            if not self.records or gap > self.records[-1][0]:
+                self.records.append([gap, location])
+        for name, count in other.constellations.items():
+            self.constellations[name] += count
+        self.end = other.end
+        self.chunks = []
+        return self
+
+    def summary(self) -> dict:
+        """Everything but the chunk entries and the boundary gaps."""
+        return {
+            "start": self.start,
+            "end": self.end,
+            "first_prime": self.first_prime,
+            "last_prime": self.last_prime,
+            "total_gaps": self.total_gaps,
+            "average_gap": self.average_gap,
+            "histogram": {str(gap): self.histogram[gap] for gap in sorted(self.histogram)},
+            "top_gaps": [list(item) for item in sorted(self.top, reverse=True)],
+            "records": self.records,
+            "constellations": dict(self.constellations),
+        }
+
+    def to_dict(self) -> dict:
+        """JSON ready form, stored in the block metadata as gap_statistics."""
+        data = self.summary()
+        data.update({"gap_sum": self.gap_sum, "chunk_size": self.chunk_size,
+                     "head": list(self.head),
+                     "tail": list(self.tail),
+                     "chunks": self.chunks})
+        return data
+
+    @classmethod
+    def from_dict(cls, data, top=TOP_GAPS) -> "GapStatistics":
+        stats = cls(data["start"], data.get("chunk_size"), top)
+        stats.end = data["end"]
+        stats.first_prime = data["first_prime"]
+        stats.last_prime = data["last_prime"]
+        stats.total_gaps = data["total_gaps"]
+        stats.gap_sum = data["gap_sum"]
+        stats.histogram = Counter({int(gap): count for gap, count in data["histogram"].items()})
+        stats.top = [tuple(item) for item in data["top_gaps"]]
+        heapq.heapify(stats.top)
+        stats.records = [list(record) for record in data["records"]]
+        stats.constellations.update(data["constellations"])
+        stats.head = bytes(data["head"])
+        stats.tail = bytes(data["tail"])
+        stats.chunks = [None if entry is None else list(entry) for entry in data["chunks"]]
+        return stats
+
+    @classmethod
+    def combine(cls, blocks) -> "GapStatistics | None":
+        """
+        Statistics of consecutive blocks as one range.
+        :param blocks: GapStatistics or their dicts, in order.
+        :return: The merged statistics, None if blocks is empty.
+        """
+        merged = None
+        for stats in blocks:
+            if isinstance(stats, dict):
+                stats = cls.from_dict(stats)
+            merged = stats if merged is None else merged.merge(stats)
+        return merged
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import sys
+import time
+import cProfile
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+EMIT_INTERVAL = 5.0  # Seconds between metric snapshots sent to the callbacks
+LARGE_GAP = 175  # Gaps above this are kept as notable events
+RECENT_GAPS = 32  # Notable gaps kept for the next snapshot
+PROFILE_DIR = "Database/profiles"  # Where per block cProfile stats are dumped
+PHASES = ("mark", "extract", "encode", "write", "stats")
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    metrics = SieveMetrics(interval=0)
+    metrics.subscribe(print_progress)
+    metrics.begin_block("demo", 0, 1_000_000)
+    with metrics.phase("mark"):
+        time.sleep(0.01)
+    metrics.segment_done(1_000_000, 78_498)
+    metrics.large_gap(492_113, 113)
+    metrics.end_block()
+
+    return
+
+
+def print_progress(snapshot) -> None:
+    """Callback that prints one progress line per snapshot."""
+    for prime, gap in snapshot["large_gaps"]:
+        print(f"Stop Prime: {prime:,} - Gap: {gap}")
+    print(f"{snapshot['block']}: {snapshot['progress']:.2f}% Complete - "
+          f"{snapshot['primes_found']:,} primes - {snapshot['primes_per_sec']:,.0f} primes/s - "
+          f"peak {snapshot['peak_memory_mb']} MB")
+    return
+
+
+def max_rss_mb() -> float | None:
+    """Process wide peak resident memory so far, None where unsupported."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class SieveMetrics:
+    """
+    Counters and phase timers for one SieveProcessor. The sieve only bumps
+    counters, snapshots go out to the subscribed callbacks at most once per
+    interval seconds, so nothing heavier than a clock read happens per window.
+
+    Profiling is opt in: with profile set every block runs under cProfile and
+    its stats are dumped to profile_dir, with trace_memory set the block runs
+    under tracemalloc and its traced peak is reported.
+    """
+
+    def __init__(self, interval=EMIT_INTERVAL, profile=False, trace_memory=False,
+                 profile_dir=PROFILE_DIR) -> None:
+        self.interval = interval
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.callbacks = []
+        self.profiler = None
+        self.reset("", 0, 0)
+
+    def reset(self, block, start, limit) -> None:
+        self.block = block
+        self.start = start
+        self.limit = limit
+        self.counters = {"primes_found": 0, "bits_processed": 0,
+                         "segments": 0, "large_gap_count": 0}
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.recent_gaps = deque(maxlen=RECENT_GAPS)
+        self.largest_gap = 0
+        self.started = time.perf_counter()
+        self.last_emit = self.started
+        return
+
+    def subscribe(self, callback) -> None:
+        """
+        Add a callback that receives every snapshot dict.
+        :param callback: callable(snapshot).
+        """
+        self.callbacks.append(callback)
+        return
+
+    def begin_block(self, block, start, limit) -> None:
+        """
+        Reset the counters and start the opt in profilers for a block.
+        :param block: Block name used in snapshots and profile files.
+        :param start: First number covered by the block.
+        :param limit: Numbers in the block.
+        """
+        self.reset(block, start, limit)
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return
+
+    def end_block(self) -> dict:
+        """Stop the profilers and send the final snapshot."""
+        if self.profiler is not None:
+            self.profiler.disable()
+            if not os.path.exists(self.profile_dir):
+                os.makedirs(self.profile_dir)
+            name = os.path.splitext(self.block)[0] or "block"
+            self.profiler.dump_stats(os.path.join(self.profile_dir, name + ".prof"))
+            self.profiler = None
+        snapshot = self.emit(force=True)
+        if self.trace_memory:
+            tracemalloc.stop()
+        return snapshot
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent inside the with block to the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def segment_done(self, bits, primes) -> None:
+        """Count one finished window and emit if the interval has passed."""
+        self.counters["segments"] += 1
+        self.counters["bits_processed"] += bits
+        self.counters["primes_found"] += primes
+        if self.callbacks and time.perf_counter() - self.last_emit >= self.interval:
+            self.emit()
+        return
+
+    def large_gap(self, prime, gap) -> None:
+        """Record a notable gap, reported with the next snapshot."""
+        self.counters["large_gap_count"] += 1
+        self.largest_gap = max(self.largest_gap, gap)
+        self.recent_gaps.append((prime, gap))
+        return
+
+    @staticmethod
+    def peak_memory_mb() -> float | None:
+        """tracemalloc peak when tracing, else the process peak RSS."""
+        if tracemalloc.is_tracing():
+            return round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        return max_rss_mb()
+
+    def snapshot(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        rate = elapsed if elapsed > 0 else 1e-9
+        return {
+            "block": self.block,
+            "start": self.start,
+            "progress": 100 * self.counters["bits_processed"] / self.limit if self.limit else 0.0,
+            **self.counters,
+            "elapsed": round(elapsed, 3),
+            "primes_per_sec": round(self.counters["primes_found"] / rate),
+            "bits_per_sec": round(self.counters["bits_processed"] / rate),
+            "timings": {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            "largest_gap": self.largest_gap,
+            "large_gaps": list(self.recent_gaps),
+            "peak_memory_mb": self.peak_memory_mb(),
+        }
+
+    def emit(self, force=False) -> dict | None:
+        """
+        Send a snapshot to every callback.
+        :param force: Ignore the interval, used at the end of a block.
+        :return: The snapshot, None if it was too soon to emit.
+        """
+        now = time.perf_counter()
+        if not force and now - self.last_emit < self.interval:
+            return None
+        self.last_emit = now
+        snapshot = self.snapshot()
+        self.recent_gaps.clear()
+        for callback in self.callbacks:
+            callback(snapshot)
+        return snapshot
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+from collections import defaultdict
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.pbm import PrimeBlockManager
+from Classes.query import PrimeQuery
+from Helper_Functions.primality import is_probable_prime
+
+# Constants
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    oracle = PrimalityOracle(PrimeBlockManager())
+    numbers = [97, 1_000_003, 4294967291, 2**61 - 1, 2**64 - 59, 2**89 - 1, 2**128 + 1]
+    for number, prime in zip(numbers, oracle.is_prime_batch(numbers)):
+        print(f"{number}: {prime}")
+    print(f"Answered from: {oracle.counts}")
+
+    return
+
+
+class PrimalityOracle:
+    """
+    Answers is_prime for any integer. Numbers inside a sieved block are
+    looked up in the database (bitmap probe or chunk lookup through
+    PrimeQuery), everything else is tested: deterministic Miller-Rabin
+    below 2**64 and BPSW above. A batch is grouped by block and sorted
+    within each block, so every block is opened once and its chunks are
+    decoded at most once per batch.
+    """
+
+    def __init__(self, pbm, query=None) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.query = query or PrimeQuery(pbm)
+        self.counts = {"database": 0, "tested": 0}  # Where the answers came from
+
+    def is_prime(self, number) -> bool:
+        return self.is_prime_batch([number])[0]
+
+    def stored(self, index) -> bool:
+        """True if block number index exists and has been sieved."""
+        if not 0 <= index < self.pbm.total_blocks:
+            return False
+        try:
+            self.query.block(PrimeQuery.block_filename(index))
+        except ValueError:
+            return False
+        return True
+
+    def is_prime_batch(self, numbers) -> list:
+        """
+        :param numbers: Sequence of integers, any size and in any order.
+        :return: List of bools in the same order as numbers.
+        """
+        results = [False] * len(numbers)
+        blocks = defaultdict(list)  # block number -> positions in numbers
+        for pos, number in enumerate(numbers):
+            if number >= 2:
+                blocks[number // self.pbm.block_size].append(pos)
+
+        for index, positions in blocks.items():
+            if self.stored(index):
+                # Ascending order keeps consecutive lookups in the same chunk
+                positions.sort(key=numbers.__getitem__)
+                for pos in positions:
+                    results[pos] = self.query.is_prime(numbers[pos])
+                self.counts["database"] += len(positions)
+            else:
+                for pos in positions:
+                    results[pos] = is_probable_prime(numbers[pos])
+                self.counts["tested"] += len(positions)
+        return results
+
+
+if __name__ == '__main__':
+    main()
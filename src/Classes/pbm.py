@@ -14,16 +14,43 @@ without restriction, subject to the conditions specified in the license.
 # Standard Library Imports
 import os
 import json
+import socket
+import struct
+from array import array
+from bisect import bisect_left
 from datetime import datetime
+from functools import partial
+from hashlib import sha256
+from itertools import accumulate, repeat
+from operator import add
 
 # Third-Party Imports
 
 # Local Imports
+from Classes.catalog import BlockCatalog
+from Classes.gapstats import GapStatistics
+from Helper_Functions.gap_codec import (CODECS, compress_frame, decompress_frame, pack_gaps,
+                                        packed_offsets, unpack_gaps)
 
 # Constants
 BITS_IN_2_32 = 2**32
 BLOCK_BATCH_SIZE = 256  # Total number of blocks to cover up to 2^40
 JSON_DIR = "Database/json_blocks"  # Directory to store JSON files
+BIN_DIR = "Database/bin_blocks"  # Directory to store binary gap files
+IO_BUFFER = 8 * 1024 * 1024  # Buffer size for block reads and writes
+CHUNK_COUNT = 512  # Chunks per block, 2^32 / 512 = 8_388_608 numbers each
+COMPRESS_WORKERS = os.cpu_count() or 1  # Threads compressing chunks, the codecs release the GIL
+
+# Binary block layout: fixed header, then the packed gaps after the first prime.
+# The header flags hold the codec id (index into CODECS) of the payload chunks.
+BIN_MAGIC = b"PGAP"
+BIN_VERSION = 1
+BIN_FIELDS = (
+    "array_start_value", "array_end_value", "first_prime", "last_prime",
+    "trailing_zeros", "total_primes", "max_gap", "start_max_gap_location",
+    "end_max_gap_location", "min_gap", "bit_array_size", "payload_size",
+)
+BIN_HEADER = struct.Struct("<4sHH" + "q" * len(BIN_FIELDS))
 
 
 def main() -> None:
@@ -41,10 +68,19 @@ def main() -> None:
 
 
 class PrimeBlockManager:
-    def __init__(self, block_size=BITS_IN_2_32, total_blocks=BLOCK_BATCH_SIZE) -> None:
+    def __init__(self, block_size=BITS_IN_2_32, total_blocks=BLOCK_BATCH_SIZE,
+                 codec="none", use_catalog=True) -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}.")
         self.block_size = block_size
         self.total_blocks = total_blocks
-        self.init_directory()
+        self.chunk_size = -(-block_size // CHUNK_COUNT)
+        self.codec = codec  # Compression of the .bin chunks
+        # Metadata of every block, kept in step with the JSON. Workers sharing
+        # Database across hosts go without it, SQLite's WAL needs shared memory
+        self.catalog = BlockCatalog() if use_catalog else None
+        self.block_names = None  # Cached list_blocks result
+        # Nothing touches the disk here, directories are made on first write
 
     @staticmethod
     def init_directory() -> None:
@@ -55,73 +91,655 @@ class PrimeBlockManager:
 
     def create_blank_blocks(self) -> None:
         """Create 256 blank JSON files with appropriate filenames."""
+        self.init_directory()
+        blocks = []
         for i in range(self.total_blocks):
             block_filename = f"2_32-{str(i).zfill(4)}.json"
-
-            blank_block = {
-                "file_version": "1.0",
-                "base": 174,
-                "conversion_type": "prime gaps",
-                "chain": {
-                    "previous_file": f"2_32-{str(i - 1).zfill(4)}.json" if i > 0 else "Genesis",
-                    "current_file": f"2_32-{str(i).zfill(4)}.json" if i < self.total_blocks - 1 else None,
-                    "next_file": f"2_32-{str(i + 1).zfill(4)}.json" if i < self.total_blocks - 1 else None,
-                },
-                "metadata": {
-                    "start_prime": i * self.block_size,
-                    "end_prime": ((i + 1) * self.block_size) - 1,
-                    "array_start_value": None,
-                    "array_end_value": None,
-                    "last_prime": None,
-                    "trailing_zeros": None,
-                    "total_primes": None,
-                    "total_gaps": None,
-                    "max_gap": None,
-                    "start_max_gap_location": None,
-                    "end_max_gap_location": None,
-                    "min_gap": None,
-                    "average_gap": None,
-                    "encoded_data_size": None,
-                    "compression_size": None,
-                    "sha256_hash": None,
-                    "bit_array_size": self.block_size,
-                },
-                "system_info": {
-                    "generator": "PrimeEncoder v2.0",
-                    "creation_date": datetime.now().isoformat(),
-                    "author": "Prime Saver",
-                    "notes": "This is for saving the primes up to as far as space "
-                             "will allow.",
-                },
-                "data": {
-                    "structure": {
-                        "chunk_size": 8_388_608,
-                        "chunk_count": 512,
-                    },
-                    "encoded_data": ""
-                }
-            }
+            blank_block = self.blank_block(i)
 
             file_path = os.path.join(JSON_DIR, block_filename)
             with open(file_path, "w") as f:
                 json.dump(blank_block, f, indent=4)
+            blocks.append((block_filename, blank_block, self.json_stamp(block_filename)))
+        if self.catalog is not None:
+            self.catalog.update_many(blocks)
+        self.block_names = None
 
         print(f"Created {self.total_blocks} blank blocks in {JSON_DIR}.")
 
         return
 
+    def blank_block(self, i) -> dict:
+        """Blank JSON layout for block number i."""
+        return {
+            "file_version": "1.0",
+            "base": 174,
+            "conversion_type": "prime gaps",
+            "chain": {
+                "previous_file": f"2_32-{str(i - 1).zfill(4)}.json" if i > 0 else "Genesis",
+                "current_file": f"2_32-{str(i).zfill(4)}.json" if i < self.total_blocks - 1 else None,
+                "next_file": f"2_32-{str(i + 1).zfill(4)}.json" if i < self.total_blocks - 1 else None,
+            },
+            "metadata": {
+                "start_prime": i * self.block_size,
+                "end_prime": ((i + 1) * self.block_size) - 1,
+                "array_start_value": None,
+                "array_end_value": None,
+                "last_prime": None,
+                "trailing_zeros": None,
+                "total_primes": None,
+                "primes_before": None,
+                "total_gaps": None,
+                "max_gap": None,
+                "start_max_gap_location": None,
+                "end_max_gap_location": None,
+                "min_gap": None,
+                "average_gap": None,
+                "gap_statistics": None,
+                "encoded_data_size": None,
+                "compression_size": None,
+                "sha256_hash": None,
+                "bit_array_size": self.block_size,
+            },
+            "system_info": {
+                "generator": "PrimeEncoder v2.0",
+                "creation_date": datetime.now().isoformat(),
+                "author": "Prime Saver",
+                "notes": "This is for saving the primes up to as far as space "
+                         "will allow.",
+            },
+            "data": {
+                "structure": {
+                    "chunk_size": self.chunk_size,
+                    "chunk_count": CHUNK_COUNT,
+                    "chunk_index": [],
+                    "chunk_hashes": None,
+                    "codec": "none",
+                },
+                "binary_file": None,
+                "encoded_data": ""
+            }
+        }
+
     @staticmethod
-    def list_blocks() -> list:
+    def scan_blocks() -> list:
         """List all block files in the directory."""
+        if not os.path.exists(JSON_DIR):
+            return []
         return sorted([f for f in os.listdir(JSON_DIR) if f.endswith(".json") and
                        "2_32" in f])
 
+    def list_blocks(self) -> list:
+        """Block filenames in order. The directory is only listed once."""
+        if self.block_names is None:
+            self.block_names = self.scan_blocks()
+        return self.block_names
+
     @staticmethod
     def load_block(filename) -> json:
-        """Load a block by filename."""
+        """Load a whole block by filename, including its encoded data."""
         with open(os.path.join(JSON_DIR, filename), "r") as f:
             return json.load(f)
 
+    def save_block_json(self, filename, block) -> None:
+        """
+        Write a block's JSON file and its catalog entry. Readers never see a
+        half written file. The temp file is named after this host and process,
+        so workers sharing the Database directory never write the same one.
+        """
+        self.init_directory()
+        path = os.path.join(JSON_DIR, filename)
+        part = f"{path}.{socket.gethostname()}-{os.getpid()}.part"
+        with open(part, "w") as f:
+            json.dump(block, f, indent=4)
+        os.replace(part, path)
+        if self.catalog is not None:
+            self.catalog.update(filename, block, self.json_stamp(filename))
+
+    @staticmethod
+    def json_stamp(filename) -> tuple:
+        """(mtime_ns, size) of a block's JSON file, tells whether a catalog entry is current."""
+        stat = os.stat(os.path.join(JSON_DIR, filename))
+        return stat.st_mtime_ns, stat.st_size
+
+    def block_info(self, filename) -> dict:
+        """
+        A block's metadata, structure and binary_file from the catalog, in the
+        same layout as the JSON block. The chunk index, chunk hashes and gap
+        statistics are only read from the catalog, and data.encoded_data from
+        the JSON file, when they are looked up. Blocks missing from the
+        catalog, or whose JSON changed since their entry was made (coordinator workers
+        commit without the catalog), are read from the JSON. Nothing is
+        written here, sync_catalog brings the entries up to date.
+        """
+        if self.catalog is None:
+            return self.load_block(filename)
+        info, stamp = self.catalog.get(filename)
+        if info is None or stamp != self.json_stamp(filename):
+            return self.load_block(filename)
+        detail = partial(self.catalog.detail, filename)
+        info["metadata"] = LazyFields(info["metadata"], {
+            "gap_statistics": partial(detail, "gap_statistics")})
+        info["data"]["structure"] = LazyFields(info["data"]["structure"], {
+            "chunk_index": partial(detail, "chunk_index"),
+            "chunk_hashes": partial(detail, "chunk_hashes")})
+        info["data"] = LazyFields(info["data"], {
+            "encoded_data": lambda: self.load_block(filename)["data"].get("encoded_data", "")})
+        return info
+
+    def get_metadata(self, filename) -> dict:
+        return self.block_info(filename)["metadata"]
+
+    def find_block_for(self, number) -> str:
+        """Filename of the block holding number."""
+        filename = None if self.catalog is None else self.catalog.find_block_for(number)
+        if filename is None:
+            filename = f"2_32-{str(number // self.block_size).zfill(4)}.json"
+        return filename
+
+    def catalog_entries(self, filenames):
+        """(filename, JSON block, stamp) for BlockCatalog.update_many, stamped before reading."""
+        for filename in filenames:
+            stamp = self.json_stamp(filename)
+            yield filename, self.load_block(filename), stamp
+
+    def rebuild_catalog(self) -> None:
+        """Rebuild the catalog from every JSON block, for blocks written before it existed."""
+        self.catalog.clear()
+        self.catalog.update_many(self.catalog_entries(self.list_blocks()))
+        return
+
+    def sync_catalog(self) -> int:
+        """
+        Make the entries of blocks that are missing from the catalog, or
+        whose JSON changed since, again.
+        :return: Number of entries made.
+        """
+        stamps = self.catalog.stamps()
+        stale = [filename for filename in self.list_blocks()
+                 if stamps.get(filename) != self.json_stamp(filename)]
+        if stale:
+            self.catalog.update_many(self.catalog_entries(stale))
+        return len(stale)
+
+    def collection_stats(self) -> dict:
+        """Totals over every block, see BlockCatalog.stats."""
+        if self.catalog is None:
+            catalog = BlockCatalog(":memory:")
+            catalog.update_many(self.catalog_entries(self.list_blocks()))
+            return catalog.stats()
+        self.sync_catalog()
+        return self.catalog.stats()
+
+    def update_prime_counts(self) -> int:
+        """
+        Fill in primes_before, the count of primes below each block's start,
+        for the leading run of sieved blocks. Blocks finish out of order, so
+        this is run from the parent process after each block completes.
+        :return: Count of primes below the first block that is not sieved yet.
+        """
+        running = 0
+        for filename in self.list_blocks():
+            info = self.block_info(filename)
+            metadata = info["metadata"]
+            if not info["data"]["binary_file"] or metadata["total_primes"] is None:
+                break
+            if metadata.get("primes_before") != running:
+                block = self.load_block(filename)
+                block["metadata"]["primes_before"] = running
+                self.save_block_json(filename, block)
+            running += metadata["total_primes"]
+        return running
+
+    def gap_statistics(self) -> GapStatistics | None:
+        """
+        Gap statistics of the leading run of sieved blocks as one range,
+        merged from the per block statistics in the catalog.
+        :return: GapStatistics from 0 up to the first block that is not
+                 sieved yet, None if genesis is not sieved.
+        """
+        blocks = []
+        for filename in self.list_blocks():
+            info = self.block_info(filename)
+            statistics = info["metadata"].get("gap_statistics")
+            if not info["data"]["binary_file"] or statistics is None:
+                break
+            blocks.append(statistics)
+        return GapStatistics.combine(blocks)
+
+    @staticmethod
+    def bin_filename(filename) -> str:
+        """2_32-0000.json -> 2_32-0000.bin"""
+        return os.path.splitext(filename)[0] + ".bin"
+
+    def open_writer(self, filename, start, checkpoint=None, tag=None) -> "BlockWriter":
+        """
+        Start streaming gaps for a block into its .bin file.
+        :param filename: JSON filename of the block.
+        :param start: First number covered by the block.
+        :param checkpoint: Optional checkpoint from ProgressManager.get_checkpoint
+                           to pick up a partly written block.
+        :param tag: Optional writer name put in the .part file names, so two
+                    processes writing the same block never share a file.
+        """
+        if not os.path.exists(BIN_DIR):
+            os.makedirs(BIN_DIR)
+        return BlockWriter(os.path.join(BIN_DIR, self.bin_filename(filename)), start,
+                           self.block_size, self.chunk_size, filename, checkpoint,
+                           self.codec, tag)
+
+    def commit_block(self, filename, writer, metadata) -> dict:
+        """
+        Finish a block's .bin file and point its JSON file at it. The JSON
+        only keeps the metadata, the gaps live in the .bin.
+        :param filename: JSON filename of the block.
+        :param writer: BlockWriter the gaps were streamed into.
+        :param metadata: Sieve metadata for the block.
+        :return: The JSON block that was written.
+        """
+        if os.path.exists(os.path.join(JSON_DIR, filename)):
+            block = self.load_block(filename)
+        else:
+            block = self.blank_block(int(filename[5:9]))
+        block["metadata"].update(metadata)
+        header = writer.close(block["metadata"])
+        block["metadata"]["encoded_data_size"] = writer.raw_size
+        block["metadata"]["compression_size"] = header["payload_size"]
+        block["data"]["structure"]["chunk_size"] = writer.chunk_size
+        block["data"]["structure"]["chunk_count"] = writer.chunk_count
+        block["data"]["structure"]["chunk_index"] = writer.chunk_index
+        block["data"]["structure"]["codec"] = writer.codec
+        block["data"]["structure"]["chunk_hashes"] = writer.chunk_hashes
+        block["metadata"]["sha256_hash"] = writer.sha256
+        block["data"]["binary_file"] = self.bin_filename(filename)
+        block["data"]["encoded_data"] = ""
+        self.save_block_json(filename, block)
+        return block
+
+    def save_block(self, filename, metadata, gaps) -> dict:
+        """
+        Write a whole block's gaps in one go.
+        :param filename: JSON filename of the block.
+        :param metadata: Sieve metadata, array_start_value is the block start.
+        :param gaps: Every gap of the block, starting from array_start_value.
+        """
+        writer = self.open_writer(filename, metadata["array_start_value"])
+        writer.write(gaps)
+        return self.commit_block(filename, writer, metadata)
+
+    @classmethod
+    def read_header(cls, filename) -> dict:
+        """Read only the fixed header of a block's .bin file."""
+        with open(os.path.join(BIN_DIR, cls.bin_filename(filename)), "rb") as f:
+            return cls.unpack_header(f.read(BIN_HEADER.size))
+
+    @staticmethod
+    def chunk_frame(block, k) -> tuple:
+        """
+        Where chunk k of a .bin block is stored. The last frame ends at the
+        payload size kept in the metadata, so the header is never read.
+        :return: (bin path, codec, first prime, payload offset, payload end,
+                  whether no later chunk of the block holds a prime)
+        """
+        index = block["data"]["structure"]["chunk_index"]
+        prime, offset, _ = index[k]
+        end = block["metadata"]["compression_size"] if k + 1 == len(index) else index[k + 1][1]
+        last = k + 1 == len(index) or index[k + 1][0] is None
+        return (os.path.join(BIN_DIR, block["data"]["binary_file"]),
+                block["data"]["structure"].get("codec", "none"), prime, offset, end, last)
+
+    @staticmethod
+    def decode_frame(path, codec, prime, offset, end, last, keep_next=False, file=None) -> array:
+        """
+        Primes of one chunk frame, see chunk_frame for the arguments.
+        :param keep_next: Keep the first prime of the next chunk, which ends
+                          the frame's gaps unless the chunk is the last.
+        :param file: Optional open .bin file to read from.
+        :return: array('Q') of ascending primes, empty if the chunk has none.
+        """
+        if prime is None:
+            return array("Q")
+        if file is None:
+            with open(path, "rb") as f:
+                f.seek(BIN_HEADER.size + offset)
+                data = f.read(end - offset)
+        else:
+            file.seek(BIN_HEADER.size + offset)
+            data = file.read(end - offset)
+        gaps = unpack_gaps(decompress_frame(data, codec))
+        primes = array("Q", accumulate(map(add, gaps, repeat(1)), initial=prime))
+        if not last and not keep_next:
+            del primes[-1]  # First prime of the next chunk, it comes again there
+        return primes
+
+    @classmethod
+    def read_chunk(cls, block, k, keep_next=False, file=None) -> array:
+        """Primes of chunk k of a .bin block, see decode_frame."""
+        return cls.decode_frame(*cls.chunk_frame(block, k), keep_next=keep_next, file=file)
+
+    def load_gaps(self, filename, stop=None) -> (dict, array):
+        """
+        Load a block's .bin file with one sequential read.
+        :param filename: JSON filename of the block.
+        :param stop: Optional number to stop at. Only the chunks up to it are
+                     read, the gaps always run at least one prime past it.
+        :return: (header, gaps) where gaps[0] is the distance from the block
+                 start to the first prime, same as the gap string.
+        """
+        size = -1
+        structure = None
+        if stop is not None:
+            block = self.block_info(filename)
+            structure = block["data"]["structure"]
+            chunk = (stop - block["metadata"]["start_prime"]) // structure["chunk_size"] + 1
+            if chunk < len(structure["chunk_index"]):
+                size = BIN_HEADER.size + structure["chunk_index"][chunk][1]
+
+        with open(os.path.join(BIN_DIR, self.bin_filename(filename)), "rb",
+                  buffering=0) as f:
+            data = f.read(size)
+        header = self.unpack_header(data[:BIN_HEADER.size])
+        payload = memoryview(data)[BIN_HEADER.size:]
+        if header["codec"] != "none":
+            if structure is None:
+                structure = self.block_info(filename)["data"]["structure"]
+            payload = self.decompress_payload(payload, structure["chunk_index"], header["codec"])
+        gaps = unpack_gaps(payload)
+        if header["first_prime"] is not None:
+            gaps.insert(0, header["first_prime"] - header["array_start_value"])
+        return header, gaps
+
+    @staticmethod
+    def decompress_payload(payload, chunk_index, codec) -> bytes:
+        """
+        Decompress the chunks of a compressed payload, or of its front part.
+        :param payload: Stored payload, starting at the first chunk.
+        :param chunk_index: The block's chunk index, entry[1] is where each chunk starts.
+        :param codec: Codec named in the header.
+        """
+        bounds = [entry[1] for entry in chunk_index if entry[1] < len(payload)]
+        bounds.append(len(payload))
+        frames = [payload[begin:end] for begin, end in zip(bounds, bounds[1:])]
+        from concurrent.futures import ThreadPoolExecutor  # Only compressed blocks need it
+        with ThreadPoolExecutor(COMPRESS_WORKERS) as pool:
+            return b"".join(pool.map(partial(decompress_frame, codec=codec), frames))
+
+    @staticmethod
+    def unpack_header(data) -> dict:
+        """Turn the raw header bytes into a dict, -1 fields become None."""
+        magic, version, flags, *values = BIN_HEADER.unpack(data)
+        if magic != BIN_MAGIC:
+            raise ValueError("Not a prime gap block file.")
+        header = dict(zip(BIN_FIELDS, values))
+        for key in ("array_end_value", "first_prime", "last_prime",
+                    "trailing_zeros", "total_primes", "max_gap", "min_gap"):
+            if header[key] < 0:
+                header[key] = None
+        header["version"] = version
+        header["flags"] = flags
+        header["codec"] = CODECS[flags & 0xFF]
+        return header
+
+
+class LazyFields(dict):
+    """Part of a cataloged block whose bulky fields are only read when first looked up."""
+
+    def __init__(self, fields, loaders) -> None:
+        super().__init__(fields)
+        self.loaders = loaders  # Field name -> function returning its value
+
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        self[key] = self.loaders[key]()
+        return self[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self or key in self.loaders else default
+
+
+class PayloadHasher:
+    """
+    SHA-256 of a block's stored payload and of every chunk frame in it,
+    fed with the payload bytes in order as they are written or read.
+    Chunk k's frame runs from bounds[k] to bounds[k + 1], the last one to
+    the end of the payload.
+    """
+
+    def __init__(self) -> None:
+        self.block = sha256()
+        self.chunk = sha256()
+        self.chunks = []  # Hex digests of the finished chunks
+        self.position = 0  # Payload bytes fed so far
+
+    def update(self, data, bounds) -> None:
+        """
+        Feed the next payload bytes.
+        :param bounds: Frame start of every chunk known so far, ascending.
+        """
+        view = memoryview(data)
+        end = self.position + len(view)
+        pos = 0
+        while len(self.chunks) + 1 < len(bounds) and bounds[len(self.chunks) + 1] <= end:
+            split = bounds[len(self.chunks) + 1] - self.position
+            self.chunk.update(view[pos:split])
+            self.chunks.append(self.chunk.hexdigest())
+            self.chunk = sha256()
+            pos = split
+        self.chunk.update(view[pos:])
+        self.block.update(view)
+        self.position = end
+        return
+
+    def finish(self, bounds) -> (str, list):
+        """:return: (payload hex digest, hex digest of every chunk)"""
+        self.update(b"", bounds)  # Closes the empty chunks at the end
+        self.chunks.append(self.chunk.hexdigest())
+        return self.block.hexdigest(), self.chunks
+
+
+class BlockWriter:
+    """
+    Streams the gaps of one block into its .bin file through a large write
+    buffer. The header is written as a placeholder and filled in by close()
+    once the metadata is known. The file is written under a .part name and
+    only renamed into place when it is complete.
+
+    While writing it builds the chunk index. Entry k is
+    [first prime >= chunk k start, payload offset of the gap after it,
+    primes in the block before it], so a reader can start decoding at any
+    chunk without touching the rest of the block.
+
+    Given a checkpoint whose .part file is still on disk, the writer cuts the
+    file back to the checkpointed payload and carries on from there.
+    resume_point then holds the checkpoint so the sieve can resume too.
+
+    With a codec other than "none", close() compresses every chunk on its own
+    across a thread pool and the chunk index points at the compressed chunks,
+    so a reader still only decompresses the chunk it needs.
+
+    The stored payload is hashed as it goes out, the whole of it and every
+    chunk frame on its own, so sha256 and chunk_hashes are ready at close()
+    without reading the file back. Compressed payloads are hashed frame by
+    frame as compress_payload writes them.
+    """
+
+    def __init__(self, path, start, size=BITS_IN_2_32, chunk_size=8_388_608,
+                 file_name=None, checkpoint=None, codec="none", tag=None) -> None:
+        self.path = path
+        self.file_name = file_name  # JSON filename, used for checkpoints
+        self.start = start
+        self.chunk_size = chunk_size
+        self.chunk_count = -(-size // chunk_size)
+        self.chunk_index = []
+        self.first_prime = None
+        self.last_prime = start - 1
+        self.total_primes = 0
+        self.payload_size = 0
+        self.raw_size = 0  # Payload size before compression
+        self.codec = codec
+        self.hasher = PayloadHasher()
+        self.sha256 = None  # Hex digest of the stored payload, set by close()
+        self.chunk_hashes = None
+        self.part_base = self.path + (f".{tag}" if tag else "")
+        self.part = self.part_base + ".part"
+        self.resume_point = None
+        if checkpoint is not None and self.restore(checkpoint["writer"]):
+            self.resume_point = checkpoint
+        else:
+            self.file = open(self.part, "wb", buffering=IO_BUFFER)
+            self.file.write(bytes(BIN_HEADER.size))
+
+    def restore(self, state) -> bool:
+        """
+        Reopen the .part file at a checkpoint.
+        :param state: Dict from checkpoint().
+        :return: False if the .part file is missing or shorter than the checkpoint.
+        """
+        size = BIN_HEADER.size + state["payload_size"]
+        if not os.path.exists(self.part) or os.path.getsize(self.part) < size:
+            return False
+        self.file = open(self.part, "r+b", buffering=IO_BUFFER)
+        self.file.truncate(size)
+        self.payload_size = state["payload_size"]
+        self.first_prime = state["first_prime"]
+        self.last_prime = state["last_prime"]
+        self.total_primes = state["total_primes"]
+        self.chunk_index = [list(entry) for entry in state["chunk_index"]]
+        if self.codec == "none":
+            # Hash objects can't be saved, the written part is hashed again once
+            self.file.seek(BIN_HEADER.size)
+            bounds = self.chunk_bounds()
+            while self.hasher.position < self.payload_size:
+                self.hasher.update(self.file.read(min(IO_BUFFER, self.payload_size -
+                                                      self.hasher.position)), bounds)
+        self.file.seek(size)
+        return True
+
+    def checkpoint(self) -> dict:
+        """Flush everything written so far to disk and return the state to resume it."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {
+            "payload_size": self.payload_size,
+            "first_prime": self.first_prime,
+            "last_prime": self.last_prime,
+            "total_primes": self.total_primes,
+            "chunk_index": [list(entry) for entry in self.chunk_index],
+        }
+
+    def write(self, gaps) -> None:
+        """Append the next run of gaps. The first gap only sets first_prime."""
+        if not len(gaps):
+            return
+        primes = list(accumulate(map(add, gaps, repeat(1)), initial=self.last_prime))
+        del primes[0]
+        skip = 0
+        if self.first_prime is None:
+            self.first_prime = primes[0]
+            gaps = gaps[1:]
+            skip = 1
+
+        self.index_chunks(primes, gaps, skip)
+        data = pack_gaps(gaps)
+        self.file.write(data)
+        if self.codec == "none":
+            self.hasher.update(data, self.chunk_bounds())
+        self.payload_size += len(data)
+        self.last_prime = primes[-1]
+        self.total_primes += len(primes)
+        return
+
+    def index_chunks(self, primes, gaps, skip) -> None:
+        """
+        Add index entries for every chunk that starts at or before the last
+        prime of this run.
+        :param primes: Primes of this run.
+        :param gaps: Gaps of this run that go into the payload.
+        :param skip: 1 when primes[0] is the block's first prime (no gap).
+        """
+        first_new = len(self.chunk_index)
+        positions = []
+        while len(self.chunk_index) < self.chunk_count:
+            chunk_start = self.start + len(self.chunk_index) * self.chunk_size
+            if chunk_start > primes[-1]:
+                break
+            pos = bisect_left(primes, chunk_start)
+            positions.append(pos)
+            self.chunk_index.append([primes[pos], None, self.total_primes + pos])
+
+        offsets = packed_offsets(gaps, [pos + 1 - skip for pos in positions])
+        for entry, offset in zip(self.chunk_index[first_new:], offsets):
+            entry[1] = self.payload_size + offset
+        return
+
+    def close(self, metadata) -> dict:
+        """
+        Fill in the header and move the finished file into place.
+        :param metadata: Sieve metadata for the block.
+        :return: The header values that were written.
+        """
+        # Chunks past the last prime have nothing to point at
+        while len(self.chunk_index) < self.chunk_count:
+            self.chunk_index.append([None, self.payload_size, self.total_primes])
+        self.raw_size = self.payload_size
+        if self.codec != "none":
+            self.compress_payload()
+        self.sha256, self.chunk_hashes = self.hasher.finish(self.chunk_bounds())
+
+        header = {key: metadata.get(key) for key in BIN_FIELDS}
+        header["array_start_value"] = self.start
+        header["first_prime"] = self.first_prime
+        header["payload_size"] = self.payload_size
+        values = [-1 if header[key] is None else header[key] for key in BIN_FIELDS]
+
+        self.file.seek(0)
+        self.file.write(BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, CODECS.index(self.codec),
+                                        *values))
+        self.file.close()
+        os.replace(self.part, self.path)
+        return header
+
+    def chunk_bounds(self) -> list:
+        """Payload offset of every indexed chunk's frame."""
+        return [entry[1] for entry in self.chunk_index]
+
+    def compress_payload(self) -> None:
+        """
+        Rewrite the finished payload chunk by chunk through the codec into a
+        second .part file and point the chunk index at the compressed chunks.
+        Chunks are read and compressed a batch at a time to bound memory.
+        """
+        self.file.close()
+        raw_part = self.part
+        from concurrent.futures import ThreadPoolExecutor  # Deferred, it is slow to import
+        self.part = self.part_base + ".cpart"
+        bounds = [entry[1] for entry in self.chunk_index] + [self.raw_size]
+        batch = COMPRESS_WORKERS * 4
+        offsets = []
+        size = 0
+        self.hasher = PayloadHasher()
+        out = open(self.part, "wb", buffering=IO_BUFFER)
+        out.write(bytes(BIN_HEADER.size))
+        with open(raw_part, "rb", buffering=IO_BUFFER) as f, \
+                ThreadPoolExecutor(COMPRESS_WORKERS) as pool:
+            f.seek(BIN_HEADER.size)
+            for first in range(0, len(self.chunk_index), batch):
+                last = min(first + batch, len(self.chunk_index))
+                frames = [f.read(bounds[k + 1] - bounds[k]) for k in range(first, last)]
+                for frame in pool.map(partial(compress_frame, codec=self.codec), frames):
+                    offsets.append(size)
+                    out.write(frame)
+                    self.hasher.update(frame, offsets)
+                    size += len(frame)
+
+        for entry, offset in zip(self.chunk_index, offsets):
+            entry[1] = offset
+        os.remove(raw_part)
+        self.file = out
+        self.payload_size = size
+        return
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,130 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import threading
+from queue import Empty, Queue
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+PIPELINE_DEPTH = 2  # Items queued between two stages before the producer waits
+STOP = object()  # Tells a stage thread to finish
+POLL_INTERVAL = 0.5  # Seconds between stage checks while waiting on a queue the stage fills
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    results = []
+    square = Stage(lambda n: results.append(n * n), name="square")
+    for n in range(10):
+        square.submit(n)
+    square.close()
+    print(f"Squares: {results}")
+
+    return
+
+
+class Stage:
+    """
+    One pipeline stage: a thread that runs func on every submitted item in
+    order. The queue in front of it is bounded, so a producer that gets
+    ahead waits instead of piling up items. An exception in func is kept
+    and raised in the producer on its next submit, drain or close, later
+    items are skipped so the producer never blocks on a dead stage.
+    """
+
+    def __init__(self, func, depth=PIPELINE_DEPTH, name="stage") -> None:
+        self.func = func
+        self.queue = Queue(maxsize=depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is STOP:
+                    return
+                if self.error is None:
+                    self.func(item)
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def check(self) -> None:
+        if self.error is not None:
+            raise self.error
+        return
+
+    def receive(self, queue):
+        """
+        Take the next item from a queue this stage fills, such as windows
+        handed back after use. Raises the stage's error instead of waiting
+        forever once the stage has failed and stopped filling it.
+        """
+        while True:
+            self.check()
+            try:
+                return queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+    def submit(self, item) -> None:
+        self.check()
+        self.queue.put(item)
+        return
+
+    def drain(self) -> None:
+        """Wait until every submitted item has been handled."""
+        self.queue.join()
+        self.check()
+        return
+
+    def close(self) -> None:
+        """Handle what is left, then stop the thread."""
+        self.queue.put(STOP)
+        self.thread.join()
+        self.check()
+        return
+
+
+class AsyncBlockWriter(Stage):
+    """
+    Puts a BlockWriter behind its own stage so packing and disk writes run
+    while the next gaps are being produced. write() only queues the gaps.
+    Everything else is read from the wrapped writer, callers drain first.
+    """
+
+    def __init__(self, writer, depth=PIPELINE_DEPTH) -> None:
+        super().__init__(writer.write, depth, name="block-writer")
+        self.writer = writer
+
+    def write(self, gaps) -> None:
+        self.submit(gaps)
+        return
+
+    def checkpoint(self) -> dict:
+        self.drain()
+        return self.writer.checkpoint()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.bitmap import BlockBitmap, bitmap_filename, open_bitmap
+from Classes.pbm import PrimeBlockManager, JSON_DIR
+
+# Constants
+CHUNK_CACHE = 64  # Decoded chunks kept in memory
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    query = PrimeQuery(PrimeBlockManager())
+    print(f"Is 4294967291 prime: {query.is_prime(4294967291)}")
+    print(f"Next prime after 1_000_000: {query.next_prime(1_000_000):_}")
+    print(f"Prev prime before 1_000_000: {query.prev_prime(1_000_000):_}")
+    print(f"The 1_000_000th prime: {query.nth_prime(1_000_000):_}")
+    print(f"pi(10**9): {query.prime_pi(10**9):_}")
+    print(f"Primes in [10**9, 2 * 10**9): {query.count_primes(10**9, 2 * 10**9):_}")
+    print(f"Primes in [100, 200): {query.primes_between(100, 200)}")
+
+    return
+
+
+class PrimeQuery:
+    """
+    Answers prime lookups from the stored .bin blocks. Each lookup finds its
+    chunk through the block's chunk index, seeks to it and decodes only that
+    chunk. Recently decoded chunks are cached. Prime counts add up the stored
+    per block and per chunk counts, so they also decode a single chunk.
+    """
+
+    def __init__(self, pbm, cache_size=CHUNK_CACHE) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.cache_size = cache_size
+        self.blocks = {}  # filename -> JSON block (metadata and chunk index)
+        self.block_counts = {}  # block number -> primes below the block start
+        self.chunks = OrderedDict()  # (filename, chunk) -> list of primes
+        self.bitmaps = {}  # filename -> complete BlockBitmap or None
+
+    @staticmethod
+    def block_filename(index) -> str:
+        return f"2_32-{str(index).zfill(4)}.json"
+
+    def block(self, filename) -> dict:
+        """Cataloged block for filename. Raises ValueError if it has no .bin yet."""
+        if filename not in self.blocks:
+            if not os.path.exists(os.path.join(JSON_DIR, filename)):
+                raise ValueError(f"Block {filename} does not exist.")
+            block = self.pbm.block_info(filename)
+            if not block["data"].get("binary_file"):
+                raise ValueError(f"Block {filename} has not been sieved.")
+            self.blocks[filename] = block
+        return self.blocks[filename]
+
+    def locate(self, number) -> (str, int):
+        """
+        Find the block and chunk that hold number.
+        :return: (filename, chunk number)
+        """
+        if number < 0:
+            raise ValueError("Number must not be negative.")
+        filename = self.block_filename(number // self.pbm.block_size)
+        block = self.block(filename)
+        offset = number - block["metadata"]["start_prime"]
+        return filename, offset // block["data"]["structure"]["chunk_size"]
+
+    def chunk(self, filename, chunk) -> list:
+        """
+        Primes of one chunk. The list starts at the first prime of the chunk
+        and ends at the first prime of the next chunk, so a neighbour lookup
+        never needs a second chunk unless the block runs out.
+        """
+        key = (filename, chunk)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+
+        primes = self.pbm.read_chunk(self.block(filename), chunk, keep_next=True).tolist()
+
+        self.chunks[key] = primes
+        if len(self.chunks) > self.cache_size:
+            self.chunks.popitem(last=False)
+        return primes
+
+    def bitmap(self, filename) -> BlockBitmap | None:
+        """
+        Read only mapping of a block's finished bitmap, plain or wheel packed,
+        None if it has none.
+        """
+        if filename not in self.bitmaps:
+            bitmap = None
+            path = bitmap_filename(filename)
+            if os.path.exists(path):
+                bitmap = open_bitmap(path)
+                if not bitmap.complete:
+                    bitmap.close()
+                    bitmap = None
+            self.bitmaps[filename] = bitmap
+        return self.bitmaps[filename]
+
+    def is_prime(self, number) -> bool:
+        """Probes the block's bitmap when there is one, otherwise decodes the chunk."""
+        if number < 0:
+            raise ValueError("Number must not be negative.")
+        bitmap = self.bitmap(self.block_filename(number // self.pbm.block_size))
+        if bitmap is not None and bitmap.covers(number):
+            return bitmap.is_prime(number)
+        filename, chunk = self.locate(number)
+        primes = self.chunk(filename, chunk)
+        pos = bisect_left(primes, number)
+        return pos < len(primes) and primes[pos] == number
+
+    def next_prime(self, number) -> int:
+        """Smallest stored prime greater than number."""
+        number = max(number, 1)
+        while True:
+            filename, chunk = self.locate(number + 1)
+            primes = self.chunk(filename, chunk)
+            pos = bisect_right(primes, number)
+            if pos < len(primes):
+                return primes[pos]
+            # Nothing left in this block, carry on from the next one
+            number = self.block(filename)["metadata"]["end_prime"]
+
+    def prev_prime(self, number) -> int | None:
+        """Largest stored prime less than number, None below 3."""
+        if number <= 2:
+            return None
+        filename, chunk = self.locate(number - 1)
+        for k in range(chunk, -1, -1):
+            primes = self.chunk(filename, k)
+            pos = bisect_left(primes, number)
+            if pos:
+                return primes[pos - 1]
+        # Nothing before number in this block, the last prime of the one before
+        index = int(filename[5:9]) - 1
+        return self.block(self.block_filename(index))["metadata"]["last_prime"]
+
+    def nth_prime(self, n) -> int:
+        """The n-th prime, counting 2 as the first."""
+        if n < 1:
+            raise ValueError("n starts at 1.")
+        remaining = n - 1
+        index = 0
+        while True:
+            filename = self.block_filename(index)
+            block = self.block(filename)
+            total = block["metadata"]["total_primes"]
+            if remaining < total:
+                break
+            remaining -= total
+            index += 1
+
+        counts = [entry[2] for entry in block["data"]["structure"]["chunk_index"]]
+        chunk = bisect_right(counts, remaining) - 1
+        return self.chunk(filename, chunk)[remaining - counts[chunk]]
+
+    def primes_before(self, index) -> int:
+        """
+        Count of primes below the start of block number index. Read from the
+        block's primes_before, or summed from the total_primes of the blocks
+        before it when the block has not been given one yet.
+        """
+        if index not in self.block_counts:
+            count = self.block(self.block_filename(index))["metadata"].get("primes_before")
+            if count is None:
+                count = 0
+                if index:
+                    previous = self.block(self.block_filename(index - 1))["metadata"]
+                    count = self.primes_before(index - 1) + previous["total_primes"]
+            self.block_counts[index] = count
+        return self.block_counts[index]
+
+    def prime_pi(self, number) -> int:
+        """
+        Count of primes <= number. Whole blocks and chunks come from the stored
+        counts, only the chunk holding number is decoded.
+        """
+        if number < 2:
+            return 0
+        filename, chunk = self.locate(number)
+        index = self.block(filename)["data"]["structure"]["chunk_index"]
+        before = self.primes_before(int(filename[5:9])) + index[chunk][2]
+        return before + bisect_right(self.chunk(filename, chunk), number)
+
+    def count_primes(self, start, stop) -> int:
+        """Count of primes p with start <= p < stop."""
+        if stop <= start:
+            return 0
+        return self.prime_pi(stop - 1) - self.prime_pi(start - 1)
+
+    def primes_between(self, start, stop) -> list:
+        """Stored primes p with start <= p < stop."""
+        result = []
+        number = max(start, 0)
+        while number < stop:
+            filename, chunk = self.locate(number)
+            block = self.block(filename)
+            chunk_size = block["data"]["structure"]["chunk_size"]
+            chunk_start = block["metadata"]["start_prime"] + chunk * chunk_size
+            chunk_end = min(chunk_start + chunk_size,
+                            block["metadata"]["end_prime"] + 1)
+            primes = self.chunk(filename, chunk)
+            result.extend(primes[bisect_left(primes, number):
+                                 bisect_left(primes, min(chunk_end, stop))])
+            number = chunk_end
+        return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import queue
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from math import isqrt
+from multiprocessing import Manager
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.bpt import BasePrimeTable
+from Classes.pbm import PrimeBlockManager
+from Classes.dpm import ProgressManager
+from Classes.metrics import SieveMetrics, print_progress
+from Classes.query import PrimeQuery
+from Classes.sieve import SieveProcessor
+
+# Constants
+JSON_DIR = "Database/json_blocks"  # Directory to store JSON files
+GENESIS_FILE = "2_32-0000.json"
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    pbm = PrimeBlockManager(block_size=2**24, total_blocks=8)
+    dpm = ProgressManager(JSON_DIR + "/progress.json")
+    dpm.load_progress()
+    scheduler = BlockScheduler(pbm, dpm)
+    scheduler.run()
+
+    return
+
+
+def block_metrics(filename, dpm=None, profile=False) -> SieveMetrics:
+    """Metrics for one block, printed and kept in progress when there is a dpm."""
+    metrics = SieveMetrics(profile=profile)
+    metrics.subscribe(print_progress)
+    if dpm is not None:
+        metrics.subscribe(partial(dpm.record_metrics, filename))
+    return metrics
+
+
+def sieve_block(filename, start_prime, block_size, checkpoint=None,
+                updates=None, profile=False, codec="none") -> (str, dict):
+    """
+    Worker side of the scheduler, runs in a child process. Maps the shared
+    base prime table, sieves the block and writes its .bin and JSON files.
+    Falls back to reading the front of the genesis block if the table does
+    not reach sqrt of the block end.
+    :param filename: JSON filename of the block.
+    :param start_prime: First number covered by the block.
+    :param block_size: Numbers per block.
+    :param checkpoint: Last checkpoint of the block, if it was cut short before.
+    :param updates: Queue that carries checkpoints and metrics back to the parent.
+    :param profile: Run the block under cProfile.
+    :param codec: Compression for the block's chunks, see PrimeBlockManager.
+    :return: (filename, metadata) for the parent to record.
+    """
+    pbm = PrimeBlockManager(block_size=block_size, codec=codec)
+    dpm = ProgressRelay(updates) if updates is not None else None
+    metrics = block_metrics(filename, dpm, profile)
+    stop = isqrt(start_prime + block_size - 1)
+    table = BasePrimeTable()
+    genesis_gaps = None
+    if table.exists() and table.open().covers(stop):
+        sieve = SieveProcessor(limit=block_size, pbm=pbm, dpm=dpm, bpt=table, metrics=metrics)
+    else:
+        _, genesis_gaps = pbm.load_gaps(GENESIS_FILE, stop)
+        sieve = SieveProcessor(limit=block_size, pbm=pbm, dpm=dpm, metrics=metrics)
+    writer = pbm.open_writer(filename, start_prime, checkpoint)
+    sieve.sieve(genesis_gaps, start_prime, writer)
+    pbm.commit_block(filename, writer, sieve.metadata)
+    table.close()
+    return filename, sieve.metadata
+
+
+class ProgressRelay:
+    """
+    Stands in for ProgressManager inside a worker process. Checkpoints and
+    metrics are queued for the parent, which is the only process writing
+    progress.
+    """
+
+    def __init__(self, updates) -> None:
+        self.updates = updates
+
+    def save_checkpoint(self, file_name, checkpoint) -> None:
+        self.updates.put(("save_checkpoint", file_name, checkpoint))
+        return
+
+    def record_metrics(self, file_name, snapshot) -> None:
+        self.updates.put(("record_metrics", file_name, snapshot))
+        return
+
+
+class BlockScheduler:
+    """
+    Runs the genesis block, then sieves every other 2_32-NNNN block in a pool
+    of worker processes. The pool is sized to the core count unless workers
+    is given, and settings.max_parallel_files is raised to match so every
+    running block has a slot in ProgressManager. Each worker process
+    handles a single block and then exits, so memory never builds up across
+    blocks.
+    """
+
+    def __init__(self, pbm, dpm, workers=None, profile=False) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.dpm = dpm  # Data Progress Manager
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers > self.dpm.progress_data["settings"]["max_parallel_files"]:
+            self.dpm.set_max_parallel_files(self.workers)
+        self.profile = profile  # Dump cProfile stats for every block
+
+    def run_genesis(self) -> None:
+        """Sieve block 0 in this process, the other blocks depend on it."""
+        sieve = SieveProcessor(limit=self.pbm.block_size, pbm=self.pbm, dpm=self.dpm,
+                               metrics=block_metrics(GENESIS_FILE, self.dpm, self.profile))
+        writer = self.pbm.open_writer(GENESIS_FILE, 0, self.dpm.get_checkpoint(GENESIS_FILE))
+        sieve.genesis_sieve(writer)
+        self.pbm.commit_block(GENESIS_FILE, writer, sieve.metadata)
+        self.dpm.update_genesis(True, sieve.metadata["last_prime"])
+        self.pbm.update_prime_counts()
+        return
+
+    def prepare_base_primes(self, pending) -> None:
+        """
+        Make sure the base prime table reaches sqrt of the last pending block
+        end. It is built once from the genesis block and then only mapped.
+        """
+        if not pending:
+            return
+        last_end = (int(pending[-1][5:9]) + 1) * self.pbm.block_size - 1
+        limit = isqrt(last_end)
+        table = BasePrimeTable()
+        if table.exists():
+            covered = table.open().covers(limit)
+            table.close()
+            if covered:
+                return
+        table.build(limit, PrimeQuery(self.pbm))
+        return
+
+    def drain_updates(self, updates) -> None:
+        """Save every checkpoint and metrics snapshot the workers have sent so far."""
+        while True:
+            try:
+                method, filename, payload = updates.get_nowait()
+            except queue.Empty:
+                return
+            getattr(self.dpm, method)(filename, payload)
+
+    def pending_blocks(self) -> list:
+        """Blocks that still need sieving, in order."""
+        done = self.dpm.progress_data["file_list"]
+        return [f for f in self.pbm.list_blocks() if f != GENESIS_FILE and not done.get(f)]
+
+    def run(self) -> None:
+        if not self.pbm.list_blocks():
+            self.pbm.create_blank_blocks()
+        elif self.pbm.catalog is not None:
+            self.pbm.sync_catalog()  # Blocks written before the catalog, or by coordinator workers
+        if not self.dpm.progress_data["sieve_metadata"]["genesis"]["completed"]:
+            self.run_genesis()
+
+        pending = self.pending_blocks()
+        self.prepare_base_primes(pending)
+        running = {}
+        with Manager() as manager, \
+                ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=1) as pool:
+            updates = manager.Queue()
+            while pending or running:
+                # Keep one block per worker in flight
+                while pending and len(running) < self.workers:
+                    filename = pending.pop(0)
+                    start_prime = int(filename[5:9]) * self.pbm.block_size
+                    self.dpm.add_in_progress_file(filename, start_prime)
+                    future = pool.submit(sieve_block, filename, start_prime,
+                                         self.pbm.block_size,
+                                         self.dpm.get_checkpoint(filename), updates,
+                                         self.profile, self.pbm.codec)
+                    running[future] = filename
+
+                finished, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+                self.drain_updates(updates)
+                for future in finished:
+                    filename = running.pop(future)
+                    _, metadata = future.result()
+                    self.dpm.mark_file_complete(filename)
+                    self.pbm.update_prime_counts()
+                    print(f"Completed {filename} - Last prime: {metadata['last_prime']:,}")
+
+        return
+
+
+if __name__ == '__main__':
+    main()
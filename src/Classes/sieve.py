@@ -12,17 +12,56 @@ without restriction, subject to the conditions specified in the license.
 
 
 # Standard Library Imports
-import sys
 import json
+from queue import Queue
+from itertools import compress, repeat
+from math import isqrt
+from operator import add, lt, sub
 
 # Third-Party Imports
 from bitarray import bitarray
 
 # Local Imports
-from base_converter import BaseConvert
+from Classes.base_converter import BaseConvert
+from Classes.bitmap import BlockBitmap, WheelBitmap
+from Classes.gapstats import GapStatistics
+from Classes.metrics import SieveMetrics, LARGE_GAP
+from Classes.pipeline import AsyncBlockWriter, Stage
+from Helper_Functions.gap_codec import pack_gaps
+from Helper_Functions.wheel import (WHEEL_PRIMES, first_wheel_multiples, mark_wheel,
+                                    wheel_bit, wheel_primes)
+
+# Constants
+SEGMENT_SIZE = 2**21  # Bits per sieve window (256 KiB), sized to stay in L2 cache
+ONE = bitarray("1")  # Search pattern for set (prime) bits
+CHECKPOINT_SEGMENTS = 64  # Windows between checkpoints when sieving into a writer
+
+
+class BufferPool:
+    """
+    Free bitarrays kept by size. Sieves take their windows and whole block
+    arrays from here and give them back when done, so sieving block after
+    block in one process reuses the same memory instead of allocating and
+    touching it again. Buffers come back dirty, callers set them first.
+    """
+
+    def __init__(self) -> None:
+        self.free = {}  # size in bits -> list of free bitarrays
+
+    def acquire(self, size) -> bitarray:
+        buffers = self.free.get(size)
+        return buffers.pop() if buffers else bitarray(size)
+
+    def release(self, buffer) -> None:
+        self.free.setdefault(len(buffer), []).append(buffer)
+        return
+
+    def clear(self) -> None:
+        self.free.clear()
+        return
 
-# Setting max string digigs
-sys.set_int_max_str_digits(1_000_000_000)
+
+BUFFERS = BufferPool()  # Shared by every SieveProcessor in the process
 
 
 def main() -> None:
@@ -30,21 +69,39 @@ def main() -> None:
     sieve = SieveProcessor(limit=10)
     sieve.print_data()
     sieve.reset_array()
+    print(f"Primes in [10**15, 10**15 + 100): {sieve.sieve_range(10**15, 10**15 + 100)}")
 
     return
 
 
 class SieveProcessor:
-    def __init__(self, limit=1_000_000, bc=None, pbm=None, dpm=None) -> None:
+    def __init__(self, limit=1_000_000, bc=None, pbm=None, dpm=None, bpt=None,
+                 segment_size=SEGMENT_SIZE, metrics=None, bitmap_path=None,
+                 pipeline_depth=0, wheel=False, pool=None) -> None:
         # setting up necessary imports from main.py
         self.bc = bc  # Base Converter
         self.pbm = pbm  # Prime Block Manager
         self.dpm = dpm  # Data Progress Manager
-
-        # setting up bit array
+        self.bpt = bpt  # Base Prime Table
+        self.metrics = metrics or SieveMetrics()  # Counters, timings and progress callbacks
+
+        # setting up bit array. Nothing is allocated here, buffers are taken
+        # from the pool when a sieve starts. In segmented mode only one window
+        # of segment_size bits is held, the full array is skipped. With a
+        # bitmap_path the block bitmap lives in a memory mapped file, created
+        # on the first sieve: the whole array mode sieves straight into it,
+        # the segmented mode copies every finished window into it.
         self.limit = limit
-        self.bit_array = bitarray(self.limit)
-        self.bit_array.setall(True)
+        self.segment_size = segment_size
+        self.pipeline_depth = pipeline_depth  # Windows queued per stage, 0 runs in line
+        # Keep only the numbers coprime to 30 in windows and bitmap, 8 bits per 30
+        self.wheel = wheel
+        if wheel and not segment_size:
+            raise ValueError("The wheel layout needs the segmented sieve.")
+        self.pool = pool or BUFFERS
+        self.bit_array = None
+        self.bitmap_path = bitmap_path
+        self.bitmap = None
         self.sieve_string = ""
         self.metadata = {
             "array_start_value": None,
@@ -55,8 +112,51 @@ class SieveProcessor:
             "encoded_data_size": 209384241,
         }
 
-    def reset_array(self) -> None:
+    def prepare_bitmap(self) -> None:
+        """Create and map the bitmap file on first use."""
+        if self.bitmap is None and self.bitmap_path is not None:
+            layout = WheelBitmap if self.wheel else BlockBitmap
+            self.bitmap = layout.create(self.bitmap_path, self.limit)
+        return
+
+    def ensure_bit_array(self) -> None:
+        """Give the whole array mode its bit_array, the bitmap bits or a pooled buffer."""
+        self.prepare_bitmap()
+        if self.bit_array is None:
+            if self.bitmap is not None:
+                self.bit_array = self.bitmap.bits  # Padded to whole bytes
+            else:
+                self.bit_array = self.pool.acquire(self.limit)
+        return
+
+    def release(self) -> None:
+        """Hand bit_array back to the pool and unmap the bitmap."""
+        if self.bit_array is not None and \
+                (self.bitmap is None or self.bit_array is not self.bitmap.bits):
+            self.pool.release(self.bit_array)
+            self.bit_array = None
+        self.close_bitmap()
+        return
+
+    def close_bitmap(self) -> None:
+        """Unmap the bitmap file, bit_array goes with it in whole array mode."""
+        if self.bitmap is not None:
+            if self.bit_array is self.bitmap.bits:
+                self.bit_array = None
+            self.bitmap.close()
+            self.bitmap = None
+        return
+
+    def reset_bits(self) -> None:
+        """Mark every number as prime again, padding bits of a bitmap stay clear."""
         self.bit_array.setall(True)
+        if self.bitmap is not None:
+            self.bitmap.clear_padding()
+        return
+
+    def reset_array(self) -> None:
+        if self.bit_array is not None:
+            self.reset_bits()
         self.sieve_string = ""
         for key, value in self.metadata.items():
             self.metadata[key] = None
@@ -78,151 +178,547 @@ class SieveProcessor:
         remainder = number % prime
         return 0 if remainder == 0 else prime - remainder
 
-    def genesis_sieve(self) -> None:
-        stop = int(self.limit ** 0.5) + 1
-        idx = 0
-        gap = 0
-        start_gap_location = 0
-        end_gap_location = 0
-        min_gap = 10000000
-        total_primes = 0
-        convert = BaseConvert()
+    @staticmethod
+    def base_primes(limit: int) -> list:
+        """
+        Simple sieve for the small primes used to cross off a larger range.
+        :param limit: Highest value (inclusive) to look for primes.
+        :return: List of primes <= limit.
+        """
+        if limit < 2:
+            return []
+        bits = bitarray(limit + 1)
+        bits.setall(True)
+        bits[:2] = False
+        for num in range(2, isqrt(limit) + 1):
+            if bits[num]:
+                bits[num * num::num] = False
+        return list(bits.search(ONE))
+
+    @staticmethod
+    def extract_gaps(bits, low: int, size: int, last_prime: int) -> (list, list):
+        """
+        Pull every prime out of a sieved window with one search call and turn
+        them into gaps with a single pairwise difference.
+        :param bits: Sieved window, bit i stands for the number low + i.
+        :param low: First number covered by the window.
+        :param size: Number of valid bits in the window.
+        :param last_prime: Prime before the window (-1 if there is none).
+        :return: (primes, gaps) where gaps[i] is the count of composites
+                 between primes[i] and the prime before it.
+        """
+        window = bits if size == len(bits) else bits[:size]
+        primes = list(map(add, window.search(ONE), repeat(low)))
+        previous = [last_prime] + primes[:-1]
+        gaps = list(map(sub, map(sub, primes, previous), repeat(1)))
+        return primes, gaps
+
+    def genesis_sieve(self, writer=None) -> None:
+        """
+        Sieves the genesis block [0, limit).
+        :param writer: Optional BlockWriter from PrimeBlockManager.open_writer.
+                       When given the gaps are streamed into the block's .bin
+                       file instead of being kept in sieve_string.
+        """
+        if self.segment_size:
+            return self.segmented_genesis_sieve(writer)
+
+        self.metrics.begin_block(self.block_name(writer, 0), 0, self.limit)
+        self.ensure_bit_array()
+        self.reset_bits()
+        if self.bitmap is not None:
+            self.bitmap.start = 0
+            self.bitmap.complete = False
+        stop = isqrt(self.limit - 1) + 1
         self.bit_array[:2] = False  # Mark 0 and 1 as non-prime
 
-        while idx < self.limit:
-            num = self.bit_array.find(1, idx)
-
-            if num < 0:
-                # No more primes; calculate trailing zeros and exit
-                last_prime = idx - 1
-                trailing_zeros = self.bit_array[idx:].count(0)
-                print(f"Last prime: {last_prime:,}")
-                self.sieve_string += f"[{convert.encode(trailing_zeros)}]"
-                self.metadata["last_prime"] = last_prime
-                self.metadata["trailing_zeros"] = trailing_zeros
-                break
-
-            if num < stop:  # Only mark multiples for primes ≤ sqrt(limit)
-                self.bit_array[num * num: self.limit + 1: num] = False
-
-            # Calculate gap and encode it
-            gap_size = num - idx
-            gap_encoding = convert.encode(gap_size)
-            self.sieve_string += gap_encoding
-
-            # Track maximum gap with location
-            if gap_size > gap:
-                gap = gap_size
-                start_gap_location = idx - 1
-                end_gap_location = num
-
-            # Track minimum gap
-            if gap_size < min_gap:
-                min_gap = gap_size
-
-            # Log progress for large gaps
-            if gap_size > 175:
-                progress = (num / self.limit) * 100
-                print(
-                    f"Stop Prime: {num:,} - Gap: {gap_size} - Encoded: {gap_encoding} - {progress:.2f}% Complete")
-
-            # counting primes
-            total_primes += 1
-            idx = num + 1
-
-        # Store metadata
-        self.metadata["array_start_value"] = 0
-        self.metadata["array_end_value"] = self.limit - 1
-        self.metadata["max_gap"] = gap
-        self.metadata["start_max_gap_location"] = start_gap_location
-        self.metadata["end_max_gap_location"] = end_gap_location
+        # Only mark multiples for primes ≤ sqrt(limit)
+        with self.metrics.phase("mark"):
+            num = self.bit_array.find(1, 0, stop)
+            while num >= 0:
+                self.bit_array[num * num: self.limit: num] = False
+                num = self.bit_array.find(1, num + 1, stop)
+
+        state = self.new_gap_state(writer)
+        # Whole length, so a mapped bitmap is searched in place (its padding is clear)
+        self.account_segment(self.bit_array, 0, len(self.bit_array), state)
+        self.finish_block(state)
+
+        return None
+
+    def segmented_genesis_sieve(self, writer=None) -> None:
+        """
+        Genesis sieve that walks the range in segment_size windows instead of
+        one bitarray(limit). Only the primes <= sqrt(limit) and a single window
+        are held in memory.
+        """
+        return self.segmented_sieve(0, self.base_primes(isqrt(self.limit - 1)), writer)
+
+    def segmented_sieve(self, start, primes, writer=None) -> None:
+        """
+        Sieves [start, start + limit) one segment_size window at a time. Each
+        base prime keeps the offset of its next multiple, so every window picks
+        up where the last one stopped.
+
+        With a writer and a dpm, every CHECKPOINT_SEGMENTS windows the written
+        gaps are flushed and the resume point (next window, running totals
+        and writer state) is saved through dpm.save_checkpoint. A writer
+        opened from a checkpoint starts again at that window.
+
+        With pipeline_depth set the work is split over three threads joined
+        by bounded queues: this one crosses off window N+1 while a stage
+        thread extracts and encodes window N and the writer thread packs and
+        writes the gaps before it. A few windows are recycled between the
+        threads. Checkpoints wait for the stages to catch up first.
+
+        With wheel set every window holds only the numbers coprime to 30,
+        segment_size bits then cover 3.75 times as many numbers and 2, 3 and
+        5 are added back when the gaps are extracted.
+        :param start: First number covered by the block.
+        :param primes: Ascending base primes, at least up to sqrt of the block end.
+        :param writer: Optional BlockWriter to stream the gaps into.
+        """
+        end = start + self.limit
+        state = self.new_gap_state(writer, start)
+        self.metrics.begin_block(self.block_name(writer, start), start, self.limit)
+        self.prepare_bitmap()
+        if self.bitmap is not None:
+            self.bitmap.start = start
+            self.bitmap.complete = False
+        first_low = start
+        resume = writer.resume_point if writer is not None else None
+        if resume is not None:
+            state.update(resume["gap_state"])
+            if "statistics" in state and isinstance(state["statistics"], dict):
+                state["statistics"] = GapStatistics.from_dict(state["statistics"])
+            else:
+                print(f"Checkpoint of {writer.file_name} has no gap statistics, "
+                      f"they only cover the rest of the block.")
+                state["statistics"] = self.new_gap_state(writer, start)["statistics"]
+            first_low = resume["next_low"]
+            self.metrics.counters["bits_processed"] = first_low - start
+            self.metrics.counters["primes_found"] = state["total_primes"]
+            print(f"Resuming {writer.file_name} at {first_low:,}")
+
+        span = self.segment_size  # Numbers per window
+        window_low = first_low
+        if self.wheel:
+            # Packed windows cover 30 numbers a byte and start on a multiple of 30
+            span = 30 * (self.segment_size // 8)
+            window_low = first_low - first_low % 30
+            offsets = first_wheel_multiples(first_low, primes)
+        else:
+            offsets = self.first_multiples(first_low, primes)
+        segment = None
+        stage = None
+        if self.pipeline_depth:
+            stage, free = self.start_pipeline(state)
+        else:
+            segment = self.pool.acquire(self.segment_size)
+
+        for count, low in enumerate(range(window_low, end, span), 1):
+            high = min(low + span, end)
+            size = high - max(low, first_low)
+            if stage is not None:
+                segment = stage.receive(free)
+            segment.setall(True)
+            if self.wheel:
+                if low < first_low:
+                    segment[:wheel_bit(first_low) - wheel_bit(low)] = False  # Before the block
+                if low == 0:
+                    segment[0] = False  # Mark 1 as non-prime
+            elif low < 2:
+                segment[:2 - low] = False  # Mark 0 and 1 as non-prime
+
+            with self.metrics.phase("mark"):
+                if self.wheel:
+                    mark_wheel(segment, wheel_bit(low), wheel_bit(high), primes, offsets, high)
+                else:
+                    self.mark_segment(segment, low, high, primes, offsets)
+            if self.bitmap is not None:
+                self.copy_to_bitmap(segment, low, high)
+
+            if stage is not None:
+                stage.submit((segment, high - size, size))
+            else:
+                self.account_segment(segment, high - size, size, state)
+            if count % CHECKPOINT_SEGMENTS == 0 and high < end:
+                if stage is not None:
+                    stage.drain()
+                self.save_checkpoint(state, high)
+
+        if stage is not None:
+            self.stop_pipeline(stage, state, writer)
+            while not free.empty():
+                self.pool.release(free.get())
+        else:
+            self.pool.release(segment)
+        self.finish_block(state)
+
+        return None
+
+    def copy_to_bitmap(self, segment, low: int, high: int) -> None:
+        """Copy the sieved window [low, high) into the block bitmap."""
+        if self.wheel:
+            origin = self.bitmap.origin
+            bits = wheel_bit(high) - wheel_bit(low)
+            self.bitmap.bits[wheel_bit(low) - origin: wheel_bit(high) - origin] = \
+                segment if bits == len(segment) else segment[:bits]
+        else:
+            start = self.bitmap.start
+            self.bitmap.bits[low - start: high - start] = \
+                segment if high - low == len(segment) else segment[:high - low]
+        return None
+
+    def window_gaps(self, segment, low: int, size: int, last_prime: int) -> (list, list):
+        """
+        extract_gaps for a window in the sieve's layout. A wheel window starts
+        at the multiple of 30 at or before low, the bits before low are clear.
+        """
+        if not self.wheel:
+            return self.extract_gaps(segment, low, size, last_prime)
+        low_bit = wheel_bit(low - low % 30)
+        primes = wheel_primes(segment, low_bit, wheel_bit(low + size) - low_bit)
+        if low < WHEEL_PRIMES[-1] + 1:
+            primes = [prime for prime in WHEEL_PRIMES if last_prime < prime < low + size] + primes
+        previous = [last_prime] + primes[:-1]
+        gaps = list(map(sub, map(sub, primes, previous), repeat(1)))
+        return primes, gaps
+
+    @classmethod
+    def first_multiples(cls, low: int, primes) -> list:
+        """First multiple of every prime at or after low, never the prime itself."""
+        return [max(prime * prime, low + cls.distance_exceed(low, prime)) for prime in primes]
+
+    @staticmethod
+    def mark_segment(segment, low: int, high: int, primes, offsets: list) -> None:
+        """
+        Cross off the multiples of primes in the window [low, high). offsets
+        holds the next multiple of each prime and is moved on to the first
+        multiple past the window, so the next window carries on from there.
+        """
+        size = high - low
+        for k, prime in enumerate(primes):
+            if prime * prime >= high:
+                break  # Later primes start crossing off past this window
+            offset = offsets[k]
+            if offset >= high:
+                continue
+            segment[offset - low: size: prime] = False
+            # Carry the next multiple over to the following window
+            offsets[k] = offset + ((high - offset + prime - 1) // prime) * prime
+        return None
+
+    def start_pipeline(self, state: dict) -> (Stage, Queue):
+        """
+        Start the extract/encode stage, and a writer stage when state has a
+        writer. Windows come back on the free queue once they are extracted.
+        :return: (first stage, queue of free windows)
+        """
+        free = Queue()
+        for _ in range(self.pipeline_depth + 2):
+            free.put(self.pool.acquire(self.segment_size))
+        if state["writer"] is not None:
+            state["writer"] = AsyncBlockWriter(state["writer"], self.pipeline_depth)
+
+        def account(item):
+            segment, low, size = item
+            try:
+                self.account_segment(segment, low, size, state)
+            finally:
+                free.put(segment)  # Also on an error, the producer may be waiting for it
+
+        return Stage(account, self.pipeline_depth, name="sieve-account"), free
+
+    @staticmethod
+    def stop_pipeline(stage: Stage, state: dict, writer) -> None:
+        """Let both stages finish, then hand state back its plain writer."""
+        stage.close()
+        if writer is not None:
+            state["writer"].close()
+            state["writer"] = writer
+        return None
+
+    def save_checkpoint(self, state: dict, next_low: int) -> None:
+        """
+        Persist the partial output and resume point of a segmented sieve.
+        :param state: Running totals after the last finished window.
+        :param next_low: First number of the next window.
+        """
+        writer = state["writer"]
+        if writer is None or self.dpm is None or writer.file_name is None:
+            return None
+        gap_state = {key: state[key] for key in (
+            "last_prime", "max_gap", "start_max_gap_location",
+            "end_max_gap_location", "min_gap", "total_primes")}
+        gap_state["statistics"] = state["statistics"].to_dict()
+        self.dpm.save_checkpoint(writer.file_name, {
+            "next_low": next_low,
+            "gap_state": gap_state,
+            "writer": writer.checkpoint(),
+        })
+        return None
+
+    @staticmethod
+    def block_name(writer, start) -> str:
+        """Name used for metrics, the block file when there is a writer."""
+        if writer is not None and writer.file_name is not None:
+            return writer.file_name
+        return f"block@{start}"
+
+    @staticmethod
+    def new_gap_state(writer=None, start=0) -> dict:
+        """Running totals carried from window to window while sieving."""
+        return {
+            "writer": writer,
+            "start": start,
+            "last_prime": start - 1,
+            "max_gap": 0,
+            "start_max_gap_location": 0,
+            "end_max_gap_location": 0,
+            "min_gap": 10000000,
+            "total_primes": 0,
+            "statistics": GapStatistics(start, writer.chunk_size if writer is not None else None),
+            "encoded": [],
+        }
+
+    def account_segment(self, segment, low: int, size: int, state: dict) -> None:
+        """
+        Feed the primes of one sieved window into the running gap statistics.
+        All of the per prime work is done as bulk reductions over the window.
+        :param segment: Sieved window, bit i stands for the number low + i.
+        :param low: First number covered by the window.
+        :param size: Number of valid bits in the window.
+        :param state: Running totals carried from window to window.
+        """
+        metrics = self.metrics
+        with metrics.phase("extract"):
+            primes, gaps = self.window_gaps(segment, low, size, state["last_prime"])
+        if not primes:
+            metrics.segment_done(size, 0)
+            return None
+
+        if state["writer"] is not None:
+            # The writer packs and writes in one call, both count as write
+            with metrics.phase("write"):
+                state["writer"].write(gaps)
+        else:
+            with metrics.phase("encode"):
+                state["encoded"].append(BaseConvert.encode_many(gaps))
+
+        # Track maximum gap with location
+        max_gap = max(gaps)
+        if max_gap > state["max_gap"]:
+            pos = gaps.index(max_gap)
+            state["max_gap"] = max_gap
+            state["start_max_gap_location"] = primes[pos - 1] if pos else state["last_prime"]
+            state["end_max_gap_location"] = primes[pos]
+
+        # Track minimum gap
+        state["min_gap"] = min(state["min_gap"], min(gaps))
+
+        with metrics.phase("stats"):
+            state["statistics"].add(primes, gaps)
+
+        # Record large gaps, they are reported with the next metrics snapshot
+        if max_gap > LARGE_GAP:
+            for pos in compress(range(len(gaps)), map(lt, repeat(LARGE_GAP), gaps)):
+                metrics.large_gap(primes[pos], gaps[pos])
+
+        state["total_primes"] += len(primes)
+        state["last_prime"] = primes[-1]
+        metrics.segment_done(size, len(primes))
+
+        return None
+
+    def finish_block(self, state: dict) -> None:
+        """
+        No more primes; calculate trailing zeros and store metadata.
+        :param state: Running totals from the last window.
+        """
+        start = state["start"]
+        last_prime = state["last_prime"]
+        trailing_zeros = start + self.limit - last_prime - 1
+        print(f"Last prime: {last_prime:,}")
+        if state["writer"] is None:
+            state["encoded"].append(f"[{BaseConvert().encode(trailing_zeros)}]")
+        self.sieve_string = "".join(state["encoded"])
+
+        self.metadata["array_start_value"] = start
+        self.metadata["array_end_value"] = start + self.limit - 1
+        self.metadata["last_prime"] = last_prime
+        self.metadata["trailing_zeros"] = trailing_zeros
+        self.metadata["max_gap"] = state["max_gap"]
+        self.metadata["start_max_gap_location"] = state["start_max_gap_location"]
+        self.metadata["end_max_gap_location"] = state["end_max_gap_location"]
         self.metadata["encoded_data_size"] = len(self.sieve_string)
-        self.metadata["min_gap"] = min_gap
-        self.metadata["total_primes"] = total_primes
+        self.metadata["min_gap"] = state["min_gap"]
+        self.metadata["total_primes"] = state["total_primes"]
+        statistics = state["statistics"]
+        statistics.finish(start + self.limit - 1)
+        self.metadata["total_gaps"] = statistics.total_gaps
+        self.metadata["average_gap"] = statistics.average_gap
+        self.metadata["gap_statistics"] = statistics.to_dict()
         self.metadata["compression_size"] = len(self.sieve_string)
+        if state["writer"] is not None:
+            self.metadata["encoded_data_size"] = state["writer"].payload_size
+            self.metadata["compression_size"] = state["writer"].payload_size
+        if self.bitmap is not None:
+            self.bitmap.clear_padding()
+            self.bitmap.flush(complete=True)
+        self.metrics.end_block()
 
         return None
 
-    def sieve(self, current_array=None, start_prime=None):
+    def sieve(self, current_array=None, start_prime=None, writer=None):
+        """
+        Sieves the block [start_prime, start_prime + limit) with the primes from
+        the genesis block. Only primes up to sqrt of the block end are used.
+        In segmented mode the block is sieved window by window and its gaps
+        and metadata are produced the same way as genesis_sieve. Otherwise
+        bit_array is crossed off, then written to writer in one go when there
+        is one, or left for convert_sieve to turn into gaps.
+        :param current_array: Genesis gaps, either the encoded gap string or a
+                              sequence of gaps such as PrimeBlockManager.load_gaps.
+                              Leave as None to take the primes straight from
+                              the memory mapped base prime table (bpt).
+        :param start_prime: First number covered by the block.
+        :param writer: Optional BlockWriter to stream the gaps into.
+        """
+        stop = isqrt(start_prime + self.limit - 1)
+        if current_array is None and self.bpt is not None:
+            primes = self.sieving_primes(stop)
+        else:
+            if isinstance(current_array, str):
+                current_array, _ = BaseConvert.decode_stream(current_array)
+            primes = []
+            prime = -1
+            for gap in current_array:
+                prime += gap + 1
+                if prime > stop:
+                    break
+                primes.append(prime)
+
+        if self.segment_size:
+            return self.segmented_sieve(start_prime, primes, writer)
+
+        if writer is not None:
+            self.metrics.begin_block(self.block_name(writer, start_prime), start_prime,
+                                     self.limit)
         # resets the bitarray without rebuilding it
+        self.ensure_bit_array()
         self.reset_array()
-        idx = 0
-        prime_count = 0
-        value = ""
-        while idx < len(current_array):
-            if current_array[idx] == "[":
-                break
-            elif current_array[idx] == ":":
-                start_idx = idx + 1
-                end_idx = current_array.find("|", start_idx)
-                if end_idx == -1 or end_idx - start_idx > 6:
-                    end_idx = start_idx + 2
-                value = current_array[start_idx:end_idx]
-                idx += (end_idx - start_idx)
-            else:
-                value = current_array[idx]
-
-            prime_count += self.bc.to_decimal(value)
-            distance = self.distance_exceed(start_prime
-                                            , prime_count)
-            if distance > len(self.bit_array):
-                self.bit_array[distance] = False
-            else:
-                self.bit_array[distance: self.limit: prime_count] = False
-            idx += 1
+        if self.bitmap is not None:
+            self.bitmap.start = start_prime
+            self.bitmap.complete = False
+        with self.metrics.phase("mark"):
+            for prime in primes:
+                # Never cross off the prime itself when it falls inside the block
+                distance = max(prime * prime - start_prime,
+                               self.distance_exceed(start_prime, prime))
+                self.bit_array[distance: self.limit: prime] = False
+        if start_prime < 2:
+            self.bit_array[:2 - start_prime] = False  # Mark 0 and 1 as non-prime
+        if writer is not None:
+            # Same as genesis_sieve, finish_block also completes the bitmap
+            state = self.new_gap_state(writer, start_prime)
+            self.account_segment(self.bit_array, start_prime, len(self.bit_array), state)
+            self.finish_block(state)
+        elif self.bitmap is not None:
+            self.bitmap.flush(complete=True)
 
         return None
 
-    def convert_sieve(self) -> (int, str, int, int):
-        last_idx = 0
-        idx = 0
-        p = 0
-        gap = 0
-        gap_size = 0
-        min_gap = 1_000_000
-        last_prime = 0
-        s = ""
-        c = ""
-        last_p = 0
-        # while idx <= self.limit:
-        #     p = self.bit_array.find(1, idx)
-        #     if p < 1:
-        #         last_p = idx - 1
-        #         s += f"[{BaseConvert((self.limit - 1) - idx).encode()}]"
-        #         break
-        #     if p == 1:
-        #         p = 2
-        #     gap_size = p - last_idx
-        #     c = BaseConvert(gap_size).encode()
-        #     s += c
-        #     if gap_size > gap:
-        #         gap = gap_size
-        #     if gap_size > 125:
-        #         d = ((idx / self.limit) * 100)
-        #         print(f"Stop Prime: {p:,} - gap: {gap_size} - Converted: {c} - "
-        #               f"{d:.2f}%")
-        #     idx = p + 1
-        #     last_idx = p
-        while idx < self.limit:
-
-            if self.bit_array[idx]:
-                c = BaseConvert(gap_size).encode()
-                s += c
-                last_prime = idx
-                if gap_size > gap:
-                    gap = gap_size
-                if gap_size < min_gap:
-                    min_gap = gap_size
-                if gap_size > 225:
-                    d = ((idx / self.limit) * 100)
-                    print(f"Stop Prime: {idx:,} - gap: {gap_size} - Converted: "
-                          f"{c} - {d:.2f}%")
-                gap_size = 0
-            else:
-                gap_size += 1
-            idx += 1
-        s += f"[{BaseConvert(gap_size).encode()}]"
-        return gap, s, gap_size, min_gap, last_prime
+    @classmethod
+    def segment_primes(cls, start: int, stop: int, primes, segment_size=SEGMENT_SIZE):
+        """
+        Segmented sieve of [start, stop) on its own, without a block, bitmap
+        or metrics. One window of segment_size bits is held at a time.
+        :param start: First number to sieve.
+        :param stop: End of the range (exclusive).
+        :param primes: Ascending base primes, at least up to sqrt(stop - 1).
+        :param segment_size: Bits per window.
+        :return: Generator of (primes, gaps) per window, gaps counted from start - 1.
+        """
+        offsets = cls.first_multiples(start, primes)
+        segment = BUFFERS.acquire(segment_size)
+        last_prime = start - 1
+        try:
+            for low in range(start, stop, segment_size):
+                high = min(low + segment_size, stop)
+                segment.setall(True)
+                if low < 2:
+                    segment[:2 - low] = False  # Mark 0 and 1 as non-prime
+                cls.mark_segment(segment, low, high, primes, offsets)
+                found, gaps = cls.extract_gaps(segment, low, high - low, last_prime)
+                if found:
+                    last_prime = found[-1]
+                    yield found, gaps
+        finally:
+            BUFFERS.release(segment)
+
+    def sieving_primes(self, number: int):
+        """
+        Base primes <= number. Taken from the base prime table, which is
+        extended on disk first when it does not reach number yet. Without a
+        table they are sieved in memory.
+        """
+        if self.bpt is None:
+            return self.base_primes(number)
+        if not self.bpt.covers(number):
+            self.bpt.extend(number)
+        return self.bpt.primes_upto(number)
+
+    def sieve_range(self, start: int, stop: int, encoding="primes"):
+        """
+        Sieves any window [start, stop), also far past the stored blocks, for
+        example [10**18, 10**18 + 10**6). Only the window and the base primes
+        up to sqrt(stop - 1) are needed, no block is made or written.
+        :param start: First number of the window.
+        :param stop: End of the window (exclusive), at most 2**64.
+        :param encoding: "primes" for a list of primes, "gaps" for the gaps
+                         counted from start - 1, "base174" for the gap string
+                         with its [trailing] marker like a JSON block, or
+                         "packed" for (first prime, packed gaps) like a .bin block.
+        """
+        if encoding not in ("primes", "gaps", "base174", "packed"):
+            raise ValueError(f"Unknown encoding {encoding}.")
+        start = max(start, 0)
+        primes, gaps = [], []
+        if stop > start:
+            base = self.sieving_primes(isqrt(stop - 1))
+            segment_size = self.segment_size or SEGMENT_SIZE
+            for found, found_gaps in self.segment_primes(start, stop, base, segment_size):
+                primes.extend(found)
+                gaps.extend(found_gaps)
+
+        if encoding == "primes":
+            return primes
+        if encoding == "gaps":
+            return gaps
+        if encoding == "packed":
+            return (primes[0], pack_gaps(gaps[1:])) if primes else (None, b"")
+        trailing_zeros = max(stop - (primes[-1] if primes else start - 1) - 1, 0)
+        return BaseConvert.encode_many(gaps) + f"[{BaseConvert().encode(trailing_zeros)}]"
+
+    def convert_sieve(self) -> (int, str, int, int, int):
+        metrics = self.metrics
+        with metrics.phase("extract"):
+            primes, gaps = self.extract_gaps(self.bit_array, 0, len(self.bit_array), -1)
+        if not primes:
+            return 0, f"[{BaseConvert(self.limit).encode()}]", self.limit, 1_000_000, 0
+
+        trailing_zeros = self.limit - primes[-1] - 1
+        with metrics.phase("encode"):
+            s = BaseConvert.encode_many(gaps)
+            s += f"[{BaseConvert().encode(trailing_zeros)}]"
+
+        gap = max(gaps)
+        if gap > 225:
+            for pos in compress(range(len(gaps)), map(lt, repeat(225), gaps)):
+                metrics.large_gap(primes[pos], gaps[pos])
+        metrics.segment_done(self.limit, len(primes))
+        return gap, s, trailing_zeros, min(gaps), primes[-1]
 
 
 if __name__ == '__main__':
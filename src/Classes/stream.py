@@ -0,0 +1,131 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain, repeat
+from operator import add, sub
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.base_converter import BaseConvert
+from Classes.pbm import PrimeBlockManager, BIN_DIR
+
+# Constants
+BATCH_SIZE = 1 << 16  # Primes per yielded array
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    stream = PrimeStream(PrimeBlockManager())
+    count = 0
+    for batch in stream.iter_primes(10**9, 10**9 + 10**6):
+        count += len(batch)
+    print(f"Primes in [10**9, 10**9 + 10**6): {count:_}")
+    for batch in stream.iter_gaps(0, 100):
+        print(f"Gaps below 100: {list(batch)}")
+
+    return
+
+
+class PrimeStream:
+    """
+    Streams stored primes over any range as array('Q') batches. Blocks are
+    read from the catalog in order and each one is decoded a chunk (.bin
+    blocks) or a slice of the gap string (older JSON blocks) at a time, so
+    memory stays the same however long the range is. A block in the range
+    that is not sieved raises ValueError rather than leaving a hole, the
+    stream ends early only where the collection itself ends.
+    """
+
+    def __init__(self, pbm, batch_size=BATCH_SIZE) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.batch_size = batch_size
+
+    def iter_primes(self, start, stop):
+        """
+        Primes p with start <= p < stop.
+        :return: Generator of array('Q') batches of at most batch_size primes.
+        """
+        start = max(start, 0)
+        stored = set(self.pbm.list_blocks())
+        batch = array("Q")
+        index = start // self.pbm.block_size
+        while index * self.pbm.block_size < stop:
+            filename = f"2_32-{str(index).zfill(4)}.json"
+            if filename not in stored:
+                break  # Past the last block
+            block = self.pbm.block_info(filename)
+            for primes in self.block_primes(block, start, filename):
+                if primes[-1] < start:
+                    continue
+                if primes[0] >= stop:
+                    break
+                batch.extend(primes[bisect_left(primes, start):bisect_left(primes, stop)])
+                while len(batch) >= self.batch_size:
+                    yield batch[:self.batch_size]
+                    del batch[:self.batch_size]
+            index += 1
+        if batch:
+            yield batch
+
+    def iter_gaps(self, start, stop):
+        """
+        Gaps of the primes in [start, stop), counted the way blocks store
+        them: the first gap runs from start - 1 to the first prime, every
+        later one is the count of composites since the prime before.
+        :return: Generator of array('Q') batches of at most batch_size gaps.
+        """
+        previous = max(start, 0) - 1
+        for primes in self.iter_primes(start, stop):
+            yield array("Q", map(sub, map(sub, primes, chain((previous,), primes)), repeat(1)))
+            previous = primes[-1]
+
+    def block_primes(self, block, start, filename=None):
+        """
+        Primes of one block from the chunk holding start onwards, one decoded
+        chunk or gap string slice at a time.
+        :return: Generator of non empty ascending sequences of primes.
+        """
+        data = block["data"]
+        first = block["metadata"]["start_prime"] - 1
+        if data.get("binary_file"):
+            yield from self.bin_primes(block, max(start, first + 1))
+            return
+        if not data["encoded_data"]:
+            raise ValueError(f"Block {filename or first + 1} has not been sieved.")
+        for gaps in BaseConvert.decode_batches(data["encoded_data"]):
+            primes = list(accumulate(map(add, gaps, repeat(1)), initial=first))
+            del primes[0]
+            if primes:
+                first = primes[-1]
+                yield primes
+
+    def bin_primes(self, block, start):
+        """Chunk by chunk primes of a .bin block, starting at the chunk that holds start."""
+        structure = block["data"]["structure"]
+        chunk = (start - block["metadata"]["start_prime"]) // structure["chunk_size"]
+        with open(os.path.join(BIN_DIR, block["data"]["binary_file"]), "rb") as f:
+            for k in range(chunk, len(structure["chunk_index"])):
+                if structure["chunk_index"][k][0] is None:
+                    return
+                primes = self.pbm.read_chunk(block, k, file=f)
+                if primes:
+                    yield primes
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import json
+import random
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.pbm import PrimeBlockManager, PayloadHasher, BIN_DIR, BIN_HEADER
+from Classes.query import PrimeQuery
+from Classes.sieve import SieveProcessor
+
+# Constants
+READ_SIZE = 8 * 1024 * 1024  # Bytes per read, every read after the first starts on a multiple
+VERIFY_WORKERS = os.cpu_count() or 1  # Processes hashing blocks
+HEADER_CHECKS = {  # .bin header field -> metadata key it must match
+    "array_start_value": "start_prime",
+    "last_prime": "last_prime",
+    "total_primes": "total_primes",
+    "payload_size": "compression_size",
+}
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    verifier = BlockVerifier(PrimeBlockManager())
+    print(json.dumps(verifier.verify(sample=8), indent=4))
+
+    return
+
+
+def verify_file(task) -> list:
+    """
+    Read one .bin file start to end and check its header and hashes. Runs
+    in a worker process. The file is read with one reused READ_SIZE buffer,
+    the first read takes the header along so every later one is aligned.
+    :param task: (bin path, expected header values, payload sha256 or None,
+                  chunk frame offsets, chunk sha256s or None)
+    :return: Problems found, empty if the block is intact.
+    """
+    path, expected, block_hash, bounds, chunk_hashes = task
+    try:
+        f = open(path, "rb", buffering=0)
+    except FileNotFoundError:
+        return ["The .bin file is missing."]
+
+    problems = []
+    hasher = PayloadHasher()
+    buffer = memoryview(bytearray(READ_SIZE))
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size != BIN_HEADER.size + expected["payload_size"]:
+            problems.append(f"File is {size:,} bytes, the metadata says "
+                            f"{BIN_HEADER.size + expected['payload_size']:,}.")
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        read = f.readinto(buffer)
+        try:
+            header = PrimeBlockManager.unpack_header(buffer[:BIN_HEADER.size])
+        except ValueError as error:
+            return problems + [str(error)]
+        for key, value in expected.items():
+            if header[key] != value:
+                problems.append(f"Header {key} is {header[key]}, expected {value}.")
+        if block_hash is None:
+            return problems  # Written before blocks were hashed, only the header is checked
+
+        hasher.update(buffer[BIN_HEADER.size:read], bounds)
+        while read:
+            read = f.readinto(buffer)
+            hasher.update(buffer[:read], bounds)
+
+    digest, chunks = hasher.finish(bounds)
+    if digest != block_hash:
+        problems.append("Payload sha256 does not match.")
+        if chunk_hashes is not None:
+            bad = [k for k, (found, stored) in enumerate(zip(chunks, chunk_hashes))
+                   if found != stored]
+            problems.append(f"Chunks with a wrong sha256: {bad}")
+    return problems
+
+
+class BlockVerifier:
+    """
+    Checks stored blocks against the sha256 hashes their writer computed:
+    every sieved block's .bin file is read once, streamed through one
+    bounded buffer, and its header, payload hash and chunk hashes are
+    compared with the metadata. Blocks are spread across a process pool.
+
+    A sample of random chunks can also be sieved again from scratch, with
+    base primes sieved in memory rather than taken from the database, and
+    compared prime by prime with the decoded chunk. That catches a block
+    that was written wrong in the first place, which no hash would.
+    """
+
+    def __init__(self, pbm, workers=VERIFY_WORKERS, query=None) -> None:
+        self.pbm = pbm  # Prime Block Manager
+        self.workers = workers
+        self.query = query or PrimeQuery(pbm)
+
+    def sieved_blocks(self) -> list:
+        return [filename for filename in self.pbm.list_blocks()
+                if self.pbm.block_info(filename)["data"]["binary_file"]]
+
+    def block_task(self, filename) -> tuple:
+        """verify_file task for one sieved block."""
+        block = self.pbm.block_info(filename)
+        metadata = block["metadata"]
+        structure = block["data"]["structure"]
+        expected = {key: metadata[name] for key, name in HEADER_CHECKS.items()}
+        expected["first_prime"] = structure["chunk_index"][0][0] \
+            if structure["chunk_index"] else None
+        return (os.path.join(BIN_DIR, block["data"]["binary_file"]), expected,
+                metadata.get("sha256_hash"), [entry[1] for entry in structure["chunk_index"]],
+                structure.get("chunk_hashes"))
+
+    def check_chunk(self, filename, chunk) -> str | None:
+        """Sieve one chunk again and compare. :return: The problem, None if it matches."""
+        block = self.query.block(filename)
+        chunk_size = block["data"]["structure"]["chunk_size"]
+        low = block["metadata"]["start_prime"] + chunk * chunk_size
+        high = min(low + chunk_size, block["metadata"]["end_prime"] + 1)
+        stored = self.query.chunk(filename, chunk)
+        stored = stored[bisect_left(stored, low):bisect_left(stored, high)]
+        sieved = SieveProcessor(limit=chunk_size).sieve_range(low, high)
+        if stored != sieved:
+            return f"{filename} chunk {chunk} [{low:,}, {high:,}) differs from a fresh sieve."
+        return None
+
+    def verify(self, sample=0, seed=None) -> dict:
+        """
+        Verify every sieved block.
+        :param sample: Number of random chunks to sieve again, 0 for none.
+        :param seed: Seed for picking the chunks.
+        :return: Report with the failed blocks and the problems found.
+        """
+        filenames = self.sieved_blocks()
+        tasks = [self.block_task(filename) for filename in filenames]
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+                results = list(pool.map(verify_file, tasks))
+        else:
+            results = list(map(verify_file, tasks))
+
+        report = {
+            "blocks": len(filenames),
+            "verified": sum(1 for task, problems in zip(tasks, results)
+                            if task[2] is not None and not problems),
+            "unhashed": [filename for filename, task in zip(filenames, tasks) if task[2] is None],
+            "failed": {filename: problems for filename, problems in zip(filenames, results)
+                       if problems},
+            "sampled_chunks": 0,
+            "sample_failures": [],
+        }
+
+        rng = random.Random(seed)
+        for _ in range(sample if filenames else 0):
+            filename = rng.choice(filenames)
+            chunk = rng.randrange(self.query.block(filename)["data"]["structure"]["chunk_count"])
+            problem = self.check_chunk(filename, chunk)
+            report["sampled_chunks"] += 1
+            if problem is not None:
+                report["sample_failures"].append(problem)
+        return report
+
+
+if __name__ == '__main__':
+    main()
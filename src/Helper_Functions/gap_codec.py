@@ -0,0 +1,170 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import re
+import bz2
+import lzma
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, compress, repeat
+from operator import add, le, rshift
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+# Gaps here are the count of composites between two primes (prime gap - 1), the
+# same values the base 174 gap string holds. Every prime gap after 2 -> 3 is
+# even, so a gap is stored as half the prime gap. 0 is free (no two primes
+# are 0 apart) and stands for the single prime gap of 1 between 2 and 3.
+# Half gaps below 128 take one byte, larger ones are LEB128 varints.
+HALF_TO_GAP = bytes([0] + [2 * half - 1 for half in range(1, 128)] + [0] * 128)
+VARINT_PATTERN = re.compile(rb"[\x80-\xff]+[\x00-\x7f]")
+# Optional entropy coding of packed chunks. Half gaps are heavily skewed
+# towards small values, so even zlib cuts a packed chunk roughly in half.
+# The position in CODECS is the codec id kept in the .bin header flags.
+CODECS = ("none", "zlib", "lzma", "bz2")
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    gaps = [0, 1, 1, 3, 1, 3, 1, 3, 5, 335, 1531]
+    packed = pack_gaps(gaps)
+    print(f"Packed {len(gaps)} gaps into {len(packed)} bytes: {packed.hex()}")
+    print(f"Unpacked: {list(unpack_gaps(packed))}")
+    for codec in CODECS:
+        frame = compress_frame(packed * 100, codec)
+        assert decompress_frame(frame, codec) == packed * 100
+        print(f"{codec}: {len(packed) * 100} -> {len(frame)} bytes")
+
+    return
+
+
+def pack_gaps(gaps) -> bytes:
+    """
+    Packs gaps as half gaps, one byte each unless a half gap is 128 or more.
+    Runs of one byte half gaps are copied in bulk, only the rare large gaps
+    are written as varints one at a time.
+    :param gaps: Sequence of gaps (composites between consecutive primes).
+    :return: Packed bytes.
+    """
+    halves = half_gaps(gaps)
+    if not halves or max(halves) < 128:
+        return bytes(halves)
+
+    packed = bytearray()
+    last = 0
+    for pos in large_positions(halves):
+        packed += bytes(halves[last:pos])
+        packed += varint(halves[pos])
+        last = pos + 1
+    packed += bytes(halves[last:])
+    return bytes(packed)
+
+
+def unpack_gaps(data) -> array:
+    """
+    Unpacks bytes made by pack_gaps back into gaps. Runs of one byte half
+    gaps are converted with one translate call, varints are found by regex.
+    :param data: Packed bytes, must start and end on a value boundary.
+    :return: array('Q') of gaps.
+    """
+    data = bytes(data)
+    gaps = array("Q")
+    last = 0
+    for match in VARINT_PATTERN.finditer(data):
+        gaps.extend(data[last:match.start()].translate(HALF_TO_GAP))
+        half = 0
+        for shift, byte in enumerate(match.group()):
+            half |= (byte & 127) << (7 * shift)
+        gaps.append(2 * half - 1)
+        last = match.end()
+    gaps.extend(data[last:].translate(HALF_TO_GAP))
+    return gaps
+
+
+def packed_offsets(gaps, indices) -> list:
+    """
+    Byte offsets into pack_gaps(gaps) without packing again.
+    :param gaps: The gaps that were packed.
+    :param indices: Gap indexes, ascending. len(gaps) is allowed.
+    :return: Byte length of pack_gaps(gaps[:i]) for every i in indices.
+    """
+    halves = half_gaps(gaps)
+    large = large_positions(halves)
+    if not large:
+        return list(indices)
+    extra = list(accumulate(len(varint(halves[pos])) - 1 for pos in large))
+    offsets = []
+    for idx in indices:
+        before = bisect_left(large, idx)
+        offsets.append(idx + (extra[before - 1] if before else 0))
+    return offsets
+
+
+def compress_frame(data, codec) -> bytes:
+    """
+    Compress one chunk of packed gaps on its own, so it can be read back
+    without the chunks around it. Empty chunks stay empty.
+    :param data: Packed gaps of one chunk.
+    :param codec: One of CODECS.
+    """
+    if not data or codec == "none":
+        return bytes(data)
+    if codec == "zlib":
+        return zlib.compress(data, 9)
+    if codec == "lzma":
+        return lzma.compress(data)
+    if codec == "bz2":
+        return bz2.compress(data, 9)
+    raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}.")
+
+
+def decompress_frame(data, codec) -> bytes:
+    """Undo compress_frame."""
+    if not data or codec == "none":
+        return bytes(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "lzma":
+        return lzma.decompress(data)
+    if codec == "bz2":
+        return bz2.decompress(data)
+    raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}.")
+
+
+def half_gaps(gaps) -> list:
+    """Gap -> half of the prime gap, 0 for the 2 -> 3 gap."""
+    return list(map(rshift, map(add, gaps, repeat(1)), repeat(1)))
+
+
+def large_positions(halves) -> list:
+    """Indexes of the half gaps that need more than one byte."""
+    return list(compress(range(len(halves)), map(le, repeat(128), halves)))
+
+
+def varint(half) -> bytes:
+    """LEB128 encoding of one half gap."""
+    packed = bytearray()
+    while half >= 128:
+        packed.append((half & 127) | 128)
+        half >>= 7
+    packed.append(half)
+    return bytes(packed)
+
+
+if __name__ == '__main__':
+    main()
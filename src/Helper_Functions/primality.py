@@ -0,0 +1,150 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+from math import isqrt
+
+# Third-Party Imports
+
+# Local Imports
+
+# Constants
+SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47)  # Trial divisors
+# Jim Sinclair's bases, a strong probable prime to all seven is prime below 2**64
+MR_BASES_64 = (2, 325, 9375, 28178, 450775, 9780504, 1795265022)
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    for number in (97, 3215031751, 2**61 - 1, 2**64 - 59, 2**89 - 1, 2**127 - 1, 2**128 + 1):
+        print(f"{number}: {is_probable_prime(number)}")
+
+    return
+
+
+def small_factor(number) -> bool | None:
+    """True or False when trial division by SMALL_PRIMES settles it, else None."""
+    if number < 2:
+        return False
+    for prime in SMALL_PRIMES:
+        if number % prime == 0:
+            return number == prime
+    if number < SMALL_PRIMES[-1] ** 2:
+        return True
+    return None
+
+
+def miller_rabin(number, bases) -> bool:
+    """
+    Strong probable prime test of an odd number > 2 to every base.
+    :return: False if some base proves number composite.
+    """
+    d = number - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    for base in bases:
+        base %= number
+        if base == 0:
+            continue
+        x = pow(base, d, number)
+        if x == 1 or x == number - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % number
+            if x == number - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def jacobi(a, n) -> int:
+    """Jacobi symbol (a/n) for odd n > 0."""
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def strong_lucas(number) -> bool:
+    """
+    Strong Lucas probable prime test with Selfridge's parameters, for odd
+    numbers that are not perfect squares.
+    :return: False if number is proven composite.
+    """
+    d = 5
+    while True:
+        symbol = jacobi(d, number)
+        if symbol == -1:
+            break
+        if symbol == 0 and abs(d) != number:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    p, q = 1, (1 - d) // 4
+
+    k = number + 1
+    s = (k & -k).bit_length() - 1
+    k >>= s
+
+    def half(value):
+        value %= number
+        return (value + number if value & 1 else value) // 2
+
+    # U_k, V_k and Q^k mod number, walking the bits of k from the top
+    u, v, qk = 1, p, q % number
+    for bit in bin(k)[3:]:
+        u, v, qk = u * v % number, (v * v - 2 * qk) % number, qk * qk % number
+        if bit == "1":
+            u, v = half(p * u + v), half(d * u + p * v)
+            qk = qk * q % number
+    if u == 0 or v == 0:
+        return True
+    for _ in range(s - 1):
+        v, qk = (v * v - 2 * qk) % number, qk * qk % number
+        if v == 0:
+            return True
+    return False
+
+
+def bpsw(number) -> bool:
+    """Baillie-PSW: base 2 strong test plus a strong Lucas test, no known counterexample."""
+    found = small_factor(number)
+    if found is not None:
+        return found
+    if isqrt(number) ** 2 == number:
+        return False
+    return miller_rabin(number, (2,)) and strong_lucas(number)
+
+
+def is_probable_prime(number) -> bool:
+    """
+    Deterministic below 2**64 (Miller-Rabin with MR_BASES_64), BPSW above.
+    """
+    found = small_factor(number)
+    if found is not None:
+        return found
+    if number < 2**64:
+        return miller_rabin(number, MR_BASES_64)
+    return bpsw(number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+from bisect import bisect_left
+
+# Third-Party Imports
+from bitarray import bitarray
+
+# Local Imports
+
+# Constants
+# Mod 30 wheel: only numbers coprime to 30 can be prime past 5, that is 8
+# residues out of every 30. Bit 8 * i + j stands for 30 * i + RESIDUES[j],
+# so one byte covers 30 numbers. Bit indexes here are counted from 0, a
+# window starting at the number 30 * i starts at bit 8 * i.
+RESIDUES = (1, 7, 11, 13, 17, 19, 23, 29)
+WHEEL_PRIMES = (2, 3, 5)  # Primes the wheel has no bit for
+RESIDUE_BIT = {residue: j for j, residue in enumerate(RESIDUES)}
+CANDIDATES_BEFORE = tuple(bisect_left(RESIDUES, r) for r in range(30))  # Residues below r
+ONE = bitarray("1")
+
+
+def main() -> None:
+    # this is used for testing and imports in other parts of the program.
+    primes = [7, 11, 13, 17]
+    bits = bitarray(wheel_bit(300))
+    bits.setall(True)
+    bits[0] = False  # 1 is not prime
+    mark_wheel(bits, 0, len(bits), primes, first_wheel_multiples(0, primes), 300)
+    print(f"Primes below 300: {list(WHEEL_PRIMES) + wheel_primes(bits, 0)}")
+
+    return
+
+
+def wheel_bit(number) -> int:
+    """Index of the bit of the first wheel number >= number."""
+    return 8 * (number // 30) + CANDIDATES_BEFORE[number % 30]
+
+
+def number_bit(number) -> int | None:
+    """Index of the bit standing for number, None if number shares a factor with 30."""
+    j = RESIDUE_BIT.get(number % 30)
+    return None if j is None else 8 * (number // 30) + j
+
+
+def first_wheel_multiples(low, primes) -> list:
+    """
+    Bit of the first multiple at or after low of every prime, once for each
+    of the 8 residues, never the prime itself. Multiples of one prime in one
+    residue are 30 * prime apart, 8 * prime bits. Entries 8k to 8k + 7
+    belong to primes[k], 2, 3 and 5 get None.
+    """
+    offsets = []
+    for prime in primes:
+        if prime in WHEEL_PRIMES:
+            offsets.extend([None] * 8)
+            continue
+        first = -(-max(prime * prime, low) // prime)  # Smallest cofactor to use
+        for residue in RESIDUES:
+            # prime is coprime to 30, so prime * m is on the wheel when m is
+            multiple = prime * (first + (residue - first) % 30)
+            offsets.append(number_bit(multiple))
+    return offsets
+
+
+def mark_wheel(bits, low_bit, high_bit, primes, offsets, high) -> None:
+    """
+    Cross off the wheel multiples of primes in the window of bits
+    [low_bit, high_bit), moving offsets on past the window.
+    :param bits: Window, bits[i] stands for the wheel bit low_bit + i.
+    :param high: First number past the window, primes with a square at or
+                 past it have nothing to cross off.
+    """
+    size = high_bit - low_bit
+    for k, prime in enumerate(primes):
+        if prime in WHEEL_PRIMES:
+            continue
+        if prime * prime >= high:
+            break
+        step = 8 * prime
+        for j in range(8 * k, 8 * k + 8):
+            offset = offsets[j]
+            if offset >= high_bit:
+                continue
+            bits[offset - low_bit: size: step] = False
+            offsets[j] = offset + ((high_bit - offset + step - 1) // step) * step
+    return
+
+
+def wheel_primes(bits, low_bit, size=None) -> list:
+    """
+    Numbers of the set bits of a window, the primes past 5 once sieved.
+    :param bits: Window, bits[i] stands for the wheel bit low_bit + i.
+    :param low_bit: Multiple of 8, the window starts on a whole byte.
+    :param size: Number of valid bits, all of them if None.
+    """
+    window = bits if size is None or size == len(bits) else bits[:size]
+    base = 30 * (low_bit >> 3)
+    return [base + 30 * (i >> 3) + RESIDUES[i & 7] for i in window.search(ONE)]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from math import isqrt
+
+# Third-Party Imports
+
+# Local Imports
+from Classes.base_converter import BaseConvert
+from Classes.metrics import max_rss_mb
+from Classes.pbm import PrimeBlockManager
+from Classes.sieve import SieveProcessor
+
+# Constants
+BENCH_DIR = "Database/bench"  # Where results and the baseline are kept
+RESULTS_FILE = BENCH_DIR + "/results.json"
+BASELINE_FILE = BENCH_DIR + "/baseline.json"
+SIZES = (10**6, 10**7, 10**8, 10**9, 2**32)  # Bits per sieve, up to a full block
+DEFAULT_MAX_SIZE = 10**7  # Larger sizes take minutes, ask for them with --max-size
+REGRESSION_TOLERANCE = 0.10  # Slower than the baseline by more than this is flagged
+BLOCK_COUNT = 64  # Blank blocks created and loaded by the block I/O benchmarks
+
+
+def main() -> None:
+    # Runs the benchmarks, writes the results and compares them to the baseline.
+    parser = argparse.ArgumentParser(description="Benchmark the sieve, codec and block I/O.")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE,
+                        help=f"Largest sieve size to run (sizes: {', '.join(map(str, SIZES))}).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, best is kept.")
+    parser.add_argument("--only", nargs="*", help="Only run these benchmarks.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory run.")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the results.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline to compare against.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed slowdown before a result counts as a regression.")
+    args = parser.parse_args()
+
+    bench = Benchmark(repeat=args.repeat, memory=not args.no_memory)
+    sizes = [size for size in SIZES if size <= args.max_size]
+    bench.run(sizes, args.only)
+    bench.save(args.output)
+    if args.save_baseline:
+        bench.save(args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = bench.compare(args.baseline, args.tolerance)
+    if regressions:
+        sys.exit(1)
+
+    return
+
+
+class Benchmark:
+    """
+    Times the hot paths at scaled sizes. Every benchmark is a method named
+    bench_<name> that takes the size and returns a setup-free callable plus
+    the work it does, so throughput can be worked out from the best time.
+    Peak memory is measured on a separate run under tracemalloc, since
+    tracing slows the timed runs down.
+    """
+
+    def __init__(self, repeat=3, memory=True) -> None:
+        self.repeat = repeat
+        self.memory = memory
+        self.results = {}
+        self.work_dir = None
+
+    @staticmethod
+    def names() -> list:
+        return [name[6:] for name in dir(Benchmark) if name.startswith("bench_")]
+
+    @staticmethod
+    def system_info() -> dict:
+        return {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def run(self, sizes, only=None) -> None:
+        """
+        Runs every benchmark (or only the named ones) at every size. The block
+        I/O benchmarks write into a temporary directory that is removed after.
+        """
+        names = only or self.names()
+        self.work_dir = tempfile.mkdtemp(prefix="prime_bench_")
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.work_dir)  # Block paths are relative to the working directory
+            for size in sizes:
+                for name in names:
+                    self.results[f"{name}@{size}"] = self.measure(name, size)
+                    self.print_result(f"{name}@{size}")
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        return
+
+    def measure(self, name, size) -> dict:
+        """
+        Best of repeat runs of one benchmark, plus its throughput and memory.
+        :return: Result dict for the JSON output.
+        """
+        best = None
+        work = {}
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            for _ in range(self.repeat):
+                func, work = getattr(self, "bench_" + name)(size)
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            peak = None
+            if self.memory:
+                func, _ = getattr(self, "bench_" + name)(size)
+                tracemalloc.start()
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        result = {"name": name, "size": size, "seconds": round(best, 6)}
+        if "primes" in work:
+            result["primes_per_sec"] = round(work["primes"] / best)
+        if "bytes" in work:
+            result["mb_per_sec"] = round(work["bytes"] / best / 1e6, 2)
+        if "items" in work:
+            result["items_per_sec"] = round(work["items"] / best)
+        result["peak_traced_mb"] = None if peak is None else round(peak / 1e6, 2)
+        result["max_rss_mb"] = max_rss_mb()
+        return result
+
+    def print_result(self, key) -> None:
+        result = self.results[key]
+        rates = [f"{result[field]:,} {label}" for field, label in (
+            ("primes_per_sec", "primes/s"), ("mb_per_sec", "MB/s"), ("items_per_sec", "items/s"))
+            if field in result]
+        memory = "" if result["peak_traced_mb"] is None else f" - peak {result['peak_traced_mb']} MB"
+        print(f"{key:<34} {result['seconds']:>10.4f}s - {' - '.join(rates)}{memory}")
+        return
+
+    def save(self, path) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "w") as f:
+            json.dump({"system_info": self.system_info(), "results": self.results}, f, indent=4)
+        return
+
+    def compare(self, path, tolerance=REGRESSION_TOLERANCE) -> list:
+        """
+        Compares against a stored baseline and prints every change.
+        :param path: Baseline JSON written by save.
+        :param tolerance: Allowed slowdown as a fraction of the baseline time.
+        :return: Keys that got slower than the tolerance allows.
+        """
+        if not os.path.exists(path):
+            print(f"No baseline at {path}, run with --save-baseline to create one.")
+            return []
+        with open(path, "r") as f:
+            baseline = json.load(f)["results"]
+
+        regressions = []
+        for key, result in self.results.items():
+            if key not in baseline:
+                continue
+            ratio = result["seconds"] / baseline[key]["seconds"]
+            flag = ""
+            if ratio > 1 + tolerance:
+                regressions.append(key)
+                flag = " REGRESSION"
+            print(f"{key:<34} {baseline[key]['seconds']:>10.4f}s -> "
+                  f"{result['seconds']:.4f}s ({ratio:.2f}x){flag}")
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {tolerance:.0%}: {', '.join(regressions)}")
+        return regressions
+
+    # Benchmarks. Each returns (callable, work) with all setup already done.
+
+    @staticmethod
+    def bench_genesis_sieve(size) -> (callable, dict):
+        """Segmented genesis sieve, gaps encoded to the base 174 string."""
+        sieve = SieveProcessor(limit=size)
+
+        def run():
+            sieve.genesis_sieve()
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 8}
+        return run, work
+
+    @staticmethod
+    def bench_genesis_sieve_array(size) -> (callable, dict):
+        """Genesis sieve over one full bit array instead of windows."""
+        sieve = SieveProcessor(limit=size, segment_size=0)
+
+        def run():
+            sieve.genesis_sieve()
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 8}
+        return run, work
+
+    @staticmethod
+    def bench_genesis_sieve_wheel(size) -> (callable, dict):
+        """Segmented genesis sieve with mod 30 wheel packed windows."""
+        sieve = SieveProcessor(limit=size, wheel=True)
+
+        def run():
+            sieve.genesis_sieve()
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 30}
+        return run, work
+
+    @staticmethod
+    def bench_sieve(size) -> (callable, dict):
+        """Sieve of the second block [size, 2 * size) from genesis gaps."""
+        primes = SieveProcessor.base_primes(isqrt(2 * size - 1))
+        gaps = [prime - prev - 1 for prev, prime in zip([-1] + primes, primes)]
+        sieve = SieveProcessor(limit=size)
+
+        def run():
+            sieve.sieve(gaps, size)
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 8}
+        return run, work
+
+    @staticmethod
+    def bench_convert_sieve(size) -> (callable, dict):
+        """Gap extraction and encoding of an already sieved bit array."""
+        sieve = SieveProcessor(limit=size, segment_size=0)
+        sieve.ensure_bit_array()
+        sieve.reset_bits()
+        for prime in SieveProcessor.base_primes(isqrt(size - 1)):
+            sieve.bit_array[prime * prime::prime] = False
+        sieve.bit_array[:2] = False
+        work = {"primes": sieve.bit_array.count(), "bytes": size // 8}
+        return sieve.convert_sieve, work
+
+    @staticmethod
+    def bench_encode(size) -> (callable, dict):
+        """BaseConvert.encode over size // 100 values, mostly small gaps."""
+        count = size // 100
+        values = [(i * 7919) % 400 for i in range(count)]
+        values[::1000] = [(i * 104_729) % 10**9 for i in range(len(values[::1000]))]
+        convert = BaseConvert()
+
+        def run():
+            for value in values:
+                convert.encode(value)
+
+        return run, {"items": count}
+
+    @staticmethod
+    def bench_to_decimal(size) -> (callable, dict):
+        """BaseConvert.to_decimal over size // 100 encoded values."""
+        count = size // 100
+        convert = BaseConvert()
+        encoded = [convert.digits((i * 104_729) % 10**9) for i in range(count)]
+
+        def run():
+            for value in encoded:
+                convert.to_decimal(value)
+
+        return run, {"items": count, "bytes": sum(map(len, encoded))}
+
+    @staticmethod
+    def bench_create_blank_blocks(size) -> (callable, dict):
+        """Creates BLOCK_COUNT blank JSON blocks of block_size = size."""
+        shutil.rmtree("Database", ignore_errors=True)
+        pbm = PrimeBlockManager(block_size=size, total_blocks=BLOCK_COUNT)
+        return pbm.create_blank_blocks, {"items": BLOCK_COUNT}
+
+    @staticmethod
+    def bench_load_block(size) -> (callable, dict):
+        """Loads BLOCK_COUNT JSON blocks of block_size = size."""
+        shutil.rmtree("Database", ignore_errors=True)
+        pbm = PrimeBlockManager(block_size=size, total_blocks=BLOCK_COUNT)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            pbm.create_blank_blocks()
+        filenames = pbm.list_blocks()
+        total = sum(os.path.getsize(os.path.join("Database/json_blocks", f)) for f in filenames)
+
+        def run():
+            for filename in filenames:
+                pbm.load_block(filename)
+
+        return run, {"items": len(filenames), "bytes": total}
+
+    @staticmethod
+    def bench_get_metadata(size) -> (callable, dict):
+        """Reads the metadata of BLOCK_COUNT blocks from the catalog."""
+        shutil.rmtree("Database", ignore_errors=True)
+        pbm = PrimeBlockManager(block_size=size, total_blocks=BLOCK_COUNT)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            pbm.create_blank_blocks()
+        filenames = pbm.list_blocks()
+
+        def run():
+            for filename in filenames:
+                pbm.get_metadata(filename)
+
+        return run, {"items": len(filenames)}
+
+    @staticmethod
+    def bench_block_write(size) -> (callable, dict):
+        """Sieves block 1 straight into its .bin file through a BlockWriter."""
+        pbm = PrimeBlockManager(block_size=size, total_blocks=2)
+        primes = SieveProcessor.base_primes(isqrt(2 * size - 1))
+        sieve = SieveProcessor(limit=size, pbm=pbm)
+        filename = "2_32-0001.json"
+
+        def run():
+            writer = pbm.open_writer(filename, size)
+            sieve.segmented_sieve(size, primes, writer)
+            pbm.commit_block(filename, writer, sieve.metadata)
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 8}
+        return run, work
+
+    @staticmethod
+    def bench_block_write_pipelined(size) -> (callable, dict):
+        """block_write with the sieve, encode and write stages on their own threads."""
+        pbm = PrimeBlockManager(block_size=size, total_blocks=2)
+        primes = SieveProcessor.base_primes(isqrt(2 * size - 1))
+        sieve = SieveProcessor(limit=size, pbm=pbm, pipeline_depth=2)
+        filename = "2_32-0001.json"
+
+        def run():
+            writer = pbm.open_writer(filename, size)
+            sieve.segmented_sieve(size, primes, writer)
+            pbm.commit_block(filename, writer, sieve.metadata)
+            work["primes"] = sieve.metadata["total_primes"]
+
+        work = {"primes": 0, "bytes": size // 8}
+        return run, work
+
+    @staticmethod
+    def bench_load_gaps(size) -> (callable, dict):
+        """Reads and unpacks every gap of a .bin block."""
+        pbm = PrimeBlockManager(block_size=size, total_blocks=2)
+        primes = SieveProcessor.base_primes(isqrt(2 * size - 1))
+        sieve = SieveProcessor(limit=size, pbm=pbm)
+        filename = "2_32-0001.json"
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            writer = pbm.open_writer(filename, size)
+            sieve.segmented_sieve(size, primes, writer)
+            pbm.commit_block(filename, writer, sieve.metadata)
+        work = {"primes": sieve.metadata["total_primes"], "bytes": writer.payload_size}
+
+        def run():
+            pbm.load_gaps(filename)
+
+        return run, work
+
+
+if __name__ == '__main__':
+    main()
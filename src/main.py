@@ -12,14 +12,16 @@ without restriction, subject to the conditions specified in the license.
 
 
 # Standard Library Imports
+import os
+import sys
+import json
+import argparse
 
 # Third-Party Imports
 
 # Local Imports
-from Classes.base_converter import BaseConvert
-from Classes.pbm import PrimeBlockManager
-from Classes.dpm import ProgressManager
-from Classes.sieve import SieveProcessor
+# Each command imports what it needs, so status and lookup start in a few
+# milliseconds without loading the sieve, the scheduler or multiprocessing.
 
 # Constants
 JSON_DIR = "Database/json_blocks"  # Directory to store JSON files
@@ -27,14 +29,144 @@ JSON_DIR = "Database/json_blocks"  # Directory to store JSON files
 
 def main() -> None:
     # This is the primary function to start your program.
+    parser = argparse.ArgumentParser(description="Prime block database.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="Sieve genesis and every pending block (default).")
+    commands.add_parser("status", help="Collection totals and progress.")
+    lookup = commands.add_parser("lookup", help="Tell whether numbers are prime.")
+    lookup.add_argument("numbers", nargs="+", type=int)
+    worker = commands.add_parser("worker", help="Sieve blocks next to other workers "
+                                                "sharing the Database directory.")
+    worker.add_argument("--max-blocks", type=int, help="Stop after this many blocks.")
+    commands.add_parser("gaps", help="Gap statistics of the sieved range, merged from "
+                                     "every block's metadata.")
+    export = commands.add_parser("export", help="Write the primes in [start, stop) to a "
+                                                ".npy or raw uint64 file.")
+    export.add_argument("start", type=int)
+    export.add_argument("stop", type=int)
+    export.add_argument("out_path")
+    export.add_argument("--format", choices=("npy", "u64"), default="npy")
+    verify = commands.add_parser("verify", help="Check every block against its sha256 "
+                                                "hashes, optionally re-sieving random chunks.")
+    verify.add_argument("--sample", type=int, default=0, help="Random chunks to sieve again.")
+    verify.add_argument("--seed", type=int, help="Seed for picking the sampled chunks.")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        return status()
+    if args.command == "lookup":
+        return lookup_numbers(args.numbers)
+    if args.command == "worker":
+        return run_worker(args.max_blocks)
+    if args.command == "gaps":
+        return gap_statistics()
+    if args.command == "export":
+        return export_primes(args.start, args.stop, args.out_path, args.format)
+    if args.command == "verify":
+        return verify_blocks(args.sample, args.seed)
+    return run()
+
+
+def run() -> None:
+    from Classes.pbm import PrimeBlockManager
+    from Classes.dpm import ProgressManager
+    from Classes.scheduler import BlockScheduler
+
+    # Setting max string digits
+    sys.set_int_max_str_digits(1_000_000_000)
+
     # Setting up the classes so they can be passed around instead of being loaded
     # each time in every class and cause a circle error.
-    convert = BaseConvert()
     pbm = PrimeBlockManager()
     dpm = ProgressManager(JSON_DIR +"/progress.json")
-    sieve = SieveProcessor(bc=convert, pbm=pbm, dpm=dpm)
+    dpm.load_progress()
+
+    # Genesis first, then every other block across the worker pool
+    scheduler = BlockScheduler(pbm=pbm, dpm=dpm)
+    scheduler.run()
+
+    return
+
+
+def run_worker(max_blocks=None) -> None:
+    """One of any number of workers claiming blocks through lease files."""
+    from Classes.pbm import PrimeBlockManager
+    from Classes.coordinator import BlockCoordinator
+
+    sys.set_int_max_str_digits(1_000_000_000)
+    coordinator = BlockCoordinator(PrimeBlockManager(use_catalog=False))
+    completed = coordinator.run(max_blocks)
+    print(f"{coordinator.worker_id} completed {completed} blocks.")
+    return
+
+
+def status() -> None:
+    """
+    Print collection totals and the saved progress status. Totals come from
+    the catalog, or straight from the JSON blocks when coordinator workers
+    share the Database directory.
+    """
+    from Classes.pbm import PrimeBlockManager
+    from Classes.dpm import ProgressManager
+
+    shared = os.path.exists(JSON_DIR + "/leases")
+    pbm = PrimeBlockManager(use_catalog=not shared)
+    if not pbm.list_blocks():
+        print("No blocks have been created yet.")
+        return
+    print(json.dumps(pbm.collection_stats(), indent=4))
+    dpm = ProgressManager(JSON_DIR + "/progress.json")
+    if dpm.read_progress() is not None:
+        print(json.dumps(dpm.progress_data["status"], indent=4))
+    if shared:
+        from Classes.coordinator import BlockCoordinator
+
+        print(json.dumps(BlockCoordinator(pbm).status(), indent=4))
+    return
+
+
+def gap_statistics() -> None:
+    """Print the merged gap statistics of the leading run of sieved blocks."""
+    from Classes.pbm import PrimeBlockManager
+
+    statistics = PrimeBlockManager().gap_statistics()
+    if statistics is None:
+        print("Genesis has not been sieved yet.")
+        return
+    print(json.dumps(statistics.summary(), indent=4))
+    return
+
+
+def export_primes(start, stop, out_path, fmt) -> None:
+    """Export a range of stored primes, decoding the chunks across a process pool."""
+    from Classes.pbm import PrimeBlockManager
+    from Classes.export import PrimeExporter
+
+    count = PrimeExporter(PrimeBlockManager()).export_primes(start, stop, out_path, fmt)
+    print(f"Wrote {count:,} primes to {out_path}.")
+    return
+
+
+def verify_blocks(sample=0, seed=None) -> None:
+    """Verify the stored blocks, exiting with status 1 if any check fails."""
+    from Classes.pbm import PrimeBlockManager
+    from Classes.verify import BlockVerifier
+
+    report = BlockVerifier(PrimeBlockManager()).verify(sample, seed)
+    print(json.dumps(report, indent=4))
+    if report["failed"] or report["sample_failures"]:
+        sys.exit(1)
+    return
+
 
+def lookup_numbers(numbers) -> None:
+    """Answer from stored blocks where possible, by primality test otherwise."""
+    from Classes.pbm import PrimeBlockManager
+    from Classes.oracle import PrimalityOracle
 
+    oracle = PrimalityOracle(PrimeBlockManager())
+    for number, prime in zip(numbers, oracle.is_prime_batch(numbers)):
+        print(f"{number}: {'prime' if prime else 'not prime'}")
     return
 
 
@@ -0,0 +1,34 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import sys
+
+# Third-Party Imports
+import pytest
+
+# Local Imports
+
+# Constants
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# The program imports Classes and Helper_Functions from src, the way main.py runs
+sys.path.insert(0, SRC_DIR)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, every Database path is relative to it."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
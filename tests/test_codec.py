@@ -0,0 +1,157 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import random
+
+# Third-Party Imports
+import pytest
+
+# Local Imports
+from Classes.base_converter import BaseConvert
+from Helper_Functions.gap_codec import (CODECS, compress_frame, decompress_frame, pack_gaps,
+                                        packed_offsets, unpack_gaps)
+
+# Constants
+BASE = len(BaseConvert.BASE)
+EDGE_VALUES = [0, 1, 9, BASE - 1, BASE, BASE + 1, BASE ** 2 - 1, BASE ** 2, BASE ** 2 + 1,
+               BASE ** 3 - 1, BASE ** 3, 10 ** 6, 10 ** 12]
+
+
+def prime_gaps(limit) -> list:
+    """Gaps of the primes below limit from a plain sieve, starting from -1 like a block."""
+    flags = bytearray([1]) * limit
+    flags[:2] = b"\x00\x00"
+    for n in range(2, int(limit ** 0.5) + 1):
+        if flags[n]:
+            flags[n * n::n] = bytes(len(range(n * n, limit, n)))
+    gaps, previous = [], -1
+    for n in range(limit):
+        if flags[n]:
+            gaps.append(n - previous - 1)
+            previous = n
+    return gaps
+
+
+def mixed_gaps(seed, count=2000) -> list:
+    """Random gaps, mostly one digit, with two and three digit groups mixed in."""
+    rng = random.Random(seed)
+    return [rng.choice((rng.randrange(BASE), rng.randrange(BASE ** 2),
+                        rng.randrange(BASE ** 2, BASE ** 4))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("value", EDGE_VALUES)
+def test_encode_round_trip(value):
+    encoded = BaseConvert().encode(value)
+    assert BaseConvert().to_decimal(encoded.strip(":|")) == value
+    assert BaseConvert.encode_many([value]) == encoded
+
+
+def test_encode_framing():
+    assert BaseConvert().encode(BASE - 1) == BaseConvert.BASE[-1]
+    assert BaseConvert().encode(BASE) == ":10"
+    assert BaseConvert().encode(BASE ** 2 - 1) == ":" + BaseConvert.BASE[-1] * 2
+    assert BaseConvert().encode(BASE ** 2) == ":100|"
+    assert BaseConvert().encode(BASE ** 3) == ":1000|"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_decode_stream_round_trip(seed):
+    gaps = mixed_gaps(seed)
+    decoded, trailing = BaseConvert.decode_stream(BaseConvert.encode_many(gaps))
+    assert list(decoded) == gaps
+    assert trailing is None
+
+
+def test_decode_stream_adjacent_groups():
+    # :xx then :xxx| then :xx, the | after the three digit group must not
+    # be taken as the end of the two digit group before it
+    gaps = [BASE, BASE ** 2, BASE + 5, 3, BASE ** 3 + 7, BASE ** 2 - 1, 0]
+    decoded, _ = BaseConvert.decode_stream(BaseConvert.encode_many(gaps))
+    assert list(decoded) == gaps
+
+
+@pytest.mark.parametrize("trailing", EDGE_VALUES)
+def test_decode_stream_trailing(trailing):
+    gaps = [1, 0, BASE, 5, BASE ** 2 + 3]
+    encoded = BaseConvert.encode_many(gaps) + f"[{BaseConvert().encode(trailing)}]"
+    decoded, found = BaseConvert.decode_stream(encoded)
+    assert list(decoded) == gaps
+    assert found == trailing
+
+
+def test_decode_stream_real_block():
+    gaps = prime_gaps(200_000)
+    encoded = BaseConvert.encode_many(gaps) + "[5]"
+    decoded, trailing = BaseConvert.decode_stream(encoded)
+    assert list(decoded) == gaps
+    assert trailing == 5
+
+
+@pytest.mark.parametrize("batch_chars", [1, 2, 3, 4, 7, 64, 1 << 20])
+def test_decode_batches_boundaries(batch_chars):
+    gaps = mixed_gaps(batch_chars, 500)
+    encoded = BaseConvert.encode_many(gaps) + f"[{BaseConvert().encode(BASE ** 2)}]"
+    batches = list(BaseConvert.decode_batches(encoded, batch_chars))
+    assert [gap for batch in batches for gap in batch] == gaps
+    if batch_chars < len(encoded) // 2:
+        assert len(batches) > 1
+
+
+def test_decode_batches_without_trailing():
+    gaps = mixed_gaps(7, 300)
+    batches = BaseConvert.decode_batches(BaseConvert.encode_many(gaps), 5)
+    assert [gap for batch in batches for gap in batch] == gaps
+
+
+def test_pack_real_gaps():
+    gaps = prime_gaps(200_000)[1:]  # A block keeps its first gap in the header
+    packed = pack_gaps(gaps)
+    assert len(packed) == len(gaps)  # Every half gap below 2**22 fits one byte
+    assert list(unpack_gaps(packed)) == gaps
+
+
+def test_pack_one_byte_limit():
+    assert len(pack_gaps([0, 2 * 127 - 1, 1])) == 3
+
+
+@pytest.mark.parametrize("half", [128, 129, 255, 256, 1000, 2 ** 14 - 1, 2 ** 14, 2 ** 21])
+def test_pack_varint_gaps(half):
+    gap = 2 * half - 1
+    gaps = [0, 1, 3, gap, 5, gap, gap, 1]
+    packed = pack_gaps(gaps)
+    assert len(packed) > len(gaps)
+    assert list(unpack_gaps(packed)) == gaps
+    assert unpack_gaps(packed[:2]).tolist() == gaps[:2]
+
+
+def test_packed_offsets():
+    gaps = [0, 1, 255, 3, 2 ** 15 + 1, 5, 1, 511, 7]
+    indices = list(range(len(gaps) + 1))
+    assert packed_offsets(gaps, indices) == [len(pack_gaps(gaps[:i])) for i in indices]
+    assert packed_offsets([1, 3], [0, 1, 2]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_frame_round_trip(codec):
+    packed = pack_gaps(prime_gaps(50_000) + [2 * 300 - 1])
+    assert decompress_frame(compress_frame(packed, codec), codec) == packed
+    assert compress_frame(b"", codec) == b""
+    assert decompress_frame(b"", codec) == b""
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        compress_frame(b"\x01", "zstd")
+    with pytest.raises(ValueError):
+        decompress_frame(b"\x01", "zstd")
@@ -0,0 +1,137 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+import random
+from bisect import bisect_left, bisect_right
+from math import isqrt
+
+# Third-Party Imports
+import pytest
+
+# Local Imports
+from Classes.bitmap import bitmap_filename
+from Classes.pbm import PrimeBlockManager
+from Classes.query import PrimeQuery
+from Classes.sieve import SieveProcessor
+
+# Constants
+BLOCK_SIZE = 1 << 14  # 512 chunks of 32 numbers
+BLOCK_COUNT = 4
+LIMIT = BLOCK_SIZE * BLOCK_COUNT
+LAYOUTS = ("chunks", "bitmap", "wheel")  # How is_prime finds its answer
+
+
+def reference_primes(limit) -> list:
+    """Primes below limit from a plain sieve, independent of SieveProcessor."""
+    flags = bytearray([1]) * limit
+    flags[:2] = b"\x00\x00"
+    for n in range(2, isqrt(limit - 1) + 1):
+        if flags[n]:
+            flags[n * n::n] = bytes(len(range(n * n, limit, n)))
+    return [n for n in range(limit) if flags[n]]
+
+
+PRIMES = reference_primes(LIMIT)
+
+
+def boundaries(pbm) -> list:
+    """Numbers on and next to every block and chunk boundary."""
+    numbers = set()
+    for edge in range(0, LIMIT + 1, pbm.chunk_size):
+        numbers.update(n for n in range(edge - 2, edge + 3) if 0 <= n < LIMIT)
+    return sorted(numbers)
+
+
+@pytest.fixture(scope="module", params=LAYOUTS)
+def database(request, tmp_path_factory):
+    """BLOCK_COUNT sieved blocks, with or without finished bitmaps."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp(request.param))
+    pbm = PrimeBlockManager(block_size=BLOCK_SIZE, total_blocks=BLOCK_COUNT)
+    pbm.create_blank_blocks()
+    base = [p for p in PRIMES if p * p < LIMIT]
+    for number, filename in enumerate(pbm.list_blocks()):
+        start = number * BLOCK_SIZE
+        bitmap = None if request.param == "chunks" else bitmap_filename(filename)
+        sieve = SieveProcessor(limit=BLOCK_SIZE, pbm=pbm, segment_size=1 << 10,
+                               bitmap_path=bitmap, wheel=request.param == "wheel")
+        writer = pbm.open_writer(filename, start)
+        sieve.segmented_sieve(start, base, writer)
+        sieve.release()
+        pbm.commit_block(filename, writer, sieve.metadata)
+    pbm.update_prime_counts()
+    yield request.param, pbm, PrimeQuery(pbm, cache_size=8)
+    os.chdir(cwd)
+
+
+def test_layout(database):
+    layout, pbm, query = database
+    for filename in pbm.list_blocks():
+        assert (query.bitmap(filename) is not None) == (layout != "chunks")
+
+
+def test_is_prime(database):
+    _, _, query = database
+    primes = set(PRIMES)
+    assert [n for n in range(LIMIT) if query.is_prime(n)] == PRIMES
+    with pytest.raises(ValueError):
+        query.is_prime(-1)
+    assert all(query.is_prime(n) == (n in primes) for n in range(LIMIT - 1, -1, -97))
+
+
+def test_next_and_prev_prime(database):
+    _, pbm, query = database
+    rng = random.Random(5)
+    numbers = boundaries(pbm) + [rng.randrange(LIMIT) for _ in range(500)]
+    for n in numbers:
+        pos = bisect_right(PRIMES, n)
+        if pos < len(PRIMES):
+            assert query.next_prime(n) == PRIMES[pos], n
+        pos = bisect_left(PRIMES, n)
+        assert query.prev_prime(n) == (PRIMES[pos - 1] if pos else None), n
+    assert query.next_prime(-5) == 2
+    assert query.prev_prime(3) == 2
+
+
+def test_nth_prime(database):
+    _, _, query = database
+    assert [query.nth_prime(n) for n in range(1, len(PRIMES) + 1)] == PRIMES
+    with pytest.raises(ValueError):
+        query.nth_prime(0)
+
+
+def test_prime_pi(database):
+    _, pbm, query = database
+    for n in boundaries(pbm) + list(range(-2, 40)):
+        assert query.prime_pi(n) == bisect_right(PRIMES, n), n
+    assert query.prime_pi(LIMIT - 1) == len(PRIMES)
+
+
+def test_primes_between(database):
+    _, pbm, query = database
+    rng = random.Random(9)
+    edges = boundaries(pbm)
+    ranges = [(0, LIMIT), (0, 3), (2, 3), (BLOCK_SIZE - 1, BLOCK_SIZE + 1), (50, 40)]
+    ranges += [tuple(sorted(rng.sample(edges, 2))) for _ in range(200)]
+    for start, stop in ranges:
+        expected = PRIMES[bisect_left(PRIMES, start):bisect_left(PRIMES, stop)]
+        assert query.primes_between(start, stop) == expected, (start, stop)
+        assert query.count_primes(start, stop) == len(expected), (start, stop)
+
+
+def test_unsieved_block(database):
+    _, _, query = database
+    with pytest.raises(ValueError):
+        query.is_prime(LIMIT + 1)
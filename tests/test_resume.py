@@ -0,0 +1,131 @@
+"""
+Prime Number V2 Program
+Copyright (c) 2024 Adam Smith
+
+Open Source Software under the Prime Number V2 Program License (Modified MIT)
+For commercial use, contact liversmiles@gmail.com.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, subject to the conditions specified in the license.
+"""
+
+
+# Standard Library Imports
+import os
+
+# Third-Party Imports
+import pytest
+
+# Local Imports
+import Classes.dpm
+import Classes.sieve
+from Classes.dpm import ProgressManager
+from Classes.pbm import PrimeBlockManager, BIN_DIR, JSON_DIR
+from Classes.sieve import SieveProcessor
+
+# Constants
+BLOCK_SIZE = 1 << 18
+SEGMENT_SIZE = 1 << 12
+FILENAME = "2_32-0001.json"
+PROGRESS_FILE = JSON_DIR + "/progress.json"
+TIMINGS = ("sieve_time", "timestamp", "date_created", "date_modified")  # Differ run to run
+
+
+class Crash(Exception):
+    """Stands in for the process dying."""
+
+
+class CrashingProgress(ProgressManager):
+    """ProgressManager that dies right after saving its n-th checkpoint."""
+
+    def __init__(self, progress_file, crash_after) -> None:
+        super().__init__(progress_file)
+        self.crash_after = crash_after
+
+    def save_checkpoint(self, file_name, checkpoint):
+        super().save_checkpoint(file_name, checkpoint)
+        self.crash_after -= 1
+        if self.crash_after == 0:
+            raise Crash
+
+
+def sieve_block(dpm, codec, pipeline_depth, wheel) -> bool:
+    """
+    Sieve block 1 into its .bin, resuming from dpm's checkpoint if it has one.
+    :return: True if the block was resumed.
+    """
+    pbm = PrimeBlockManager(block_size=BLOCK_SIZE, total_blocks=2, codec=codec)
+    if not pbm.list_blocks():
+        pbm.create_blank_blocks()
+    base = SieveProcessor.base_primes(int((2 * BLOCK_SIZE) ** 0.5))
+    sieve = SieveProcessor(limit=BLOCK_SIZE, pbm=pbm, dpm=dpm, segment_size=SEGMENT_SIZE,
+                           pipeline_depth=pipeline_depth, wheel=wheel)
+    writer = pbm.open_writer(FILENAME, BLOCK_SIZE, dpm.get_checkpoint(FILENAME))
+    try:
+        sieve.segmented_sieve(BLOCK_SIZE, base, writer)
+    except Crash:
+        writer.file.close()
+        raise
+    pbm.commit_block(FILENAME, writer, sieve.metadata)
+    return writer.resume_point is not None
+
+
+def stored_block() -> (bytes, dict):
+    """The block's .bin bytes and its metadata without the timings."""
+    with open(os.path.join(BIN_DIR, PrimeBlockManager.bin_filename(FILENAME)), "rb") as f:
+        data = f.read()
+    metadata = PrimeBlockManager.load_block(FILENAME)["metadata"]
+    return data, {key: value for key, value in metadata.items() if key not in TIMINGS}
+
+
+@pytest.mark.parametrize("wheel", [False, True], ids=["plain", "wheel"])
+@pytest.mark.parametrize("pipeline_depth", [0, 2])
+@pytest.mark.parametrize("codec", ["none", "zlib"])
+def test_resume_is_byte_identical(workdir, monkeypatch, codec, pipeline_depth, wheel):
+    monkeypatch.setattr(Classes.sieve, "CHECKPOINT_SEGMENTS", 1)
+    monkeypatch.setattr(Classes.dpm, "COMPACT_EVERY", 3)  # Replay a snapshot and a journal
+
+    os.makedirs("uninterrupted")
+    monkeypatch.chdir("uninterrupted")
+    dpm = ProgressManager(PROGRESS_FILE)
+    dpm.load_progress()
+    dpm.add_in_progress_file(FILENAME, BLOCK_SIZE)
+    assert not sieve_block(dpm, codec, pipeline_depth, wheel)
+    expected = stored_block()
+
+    os.makedirs(workdir / "crashed")
+    monkeypatch.chdir(workdir / "crashed")
+    dpm = CrashingProgress(PROGRESS_FILE, crash_after=5)
+    dpm.load_progress()
+    dpm.add_in_progress_file(FILENAME, BLOCK_SIZE)
+    with pytest.raises(Crash):
+        sieve_block(dpm, codec, pipeline_depth, wheel)
+    assert not os.path.exists(os.path.join(BIN_DIR, PrimeBlockManager.bin_filename(FILENAME)))
+
+    dpm = ProgressManager(PROGRESS_FILE)  # A fresh process reads the snapshot and journal
+    dpm.load_progress()
+    checkpoint = dpm.get_checkpoint(FILENAME)
+    assert checkpoint is not None and checkpoint["next_low"] > BLOCK_SIZE
+    assert sieve_block(dpm, codec, pipeline_depth, wheel)
+
+    data, metadata = stored_block()
+    assert data == expected[0]
+    assert metadata == expected[1]
+
+
+def test_whole_block_sieve_writes_through_writer(workdir):
+    pbm = PrimeBlockManager(block_size=BLOCK_SIZE, total_blocks=2)
+    pbm.create_blank_blocks()
+    base = SieveProcessor.base_primes(int((2 * BLOCK_SIZE) ** 0.5))
+    gaps = [prime - previous - 1 for previous, prime in zip([-1] + base, base)]
+    stored = []
+    for segment_size in (SEGMENT_SIZE, 0):
+        sieve = SieveProcessor(limit=BLOCK_SIZE, pbm=pbm, segment_size=segment_size)
+        writer = pbm.open_writer(FILENAME, BLOCK_SIZE)
+        sieve.sieve(gaps, BLOCK_SIZE, writer)
+        pbm.commit_block(FILENAME, writer, sieve.metadata)
+        stored.append(stored_block())
+
+    assert stored[1][0] == stored[0][0]
+    assert stored[1][1] == stored[0][1]